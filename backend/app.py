@@ -2,35 +2,130 @@
 import json
 import hashlib
 import time
-import random
 import math
 import statistics  # Needed for median calculation
 import os
+import sys
+import mmap
+import struct
+import bisect
+import functools
+import gc
+import heapq
+import itertools
+import atexit
+import sqlite3
+import threading
+import weakref
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from types import SimpleNamespace
 from dataclasses import dataclass, field, asdict
-from typing import List, Dict, Optional
-from flask import Flask, request, jsonify
+from typing import List, Dict, Optional, Tuple
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 
 # --- DATASTRUCTURES / SCHEMAS ---
-@dataclass
+_INTERN_MAX_LEN = 64  # Longer strings (free responses) are not worth interning
+
+def _intern(value: str) -> str:
+    return sys.intern(value) if len(value) <= _INTERN_MAX_LEN else value
+
+
 class Payload:
-    answer: str
-    hash: str
+    """An answer and its SHA-256 digest, kept as 32 raw bytes.
+
+    ``hash`` still returns the hex string, but hot paths key on ``digest``.
+    Payloads are immutable, so equal short answers share one instance
+    through ``Payload.intern``.
+    """
+    __slots__ = ('answer', 'digest')
+    _interned: Dict[bytes, 'Payload'] = {}
+    _INTERN_LIMIT = 4096
+
+    def __init__(self, answer: str, hash: Optional[str] = None, digest: Optional[bytes] = None):
+        self.answer = _intern(answer)
+        self.digest = digest if digest is not None else bytes.fromhex(hash)
+
+    @classmethod
+    def intern(cls, answer: str, digest: bytes) -> 'Payload':
+        payload = cls._interned.get(digest)
+        if payload is None:
+            payload = cls(answer, digest=digest)
+            if len(answer) <= _INTERN_MAX_LEN and len(cls._interned) < cls._INTERN_LIMIT:
+                cls._interned[digest] = payload
+        return payload
+
+    @property
+    def hash(self) -> str:
+        return self.digest.hex()
+
+    def __eq__(self, other):
+        if not isinstance(other, Payload):
+            return NotImplemented
+        return self.digest == other.digest and self.answer == other.answer
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __repr__(self):
+        return f"Payload(answer={self.answer!r}, hash={self.hash!r})"
+
+
+_ANSWER_CACHE_SIZE = 1024
+
+@functools.lru_cache(maxsize=_ANSWER_CACHE_SIZE)
+def _cached_answer_payload(ans: str) -> Payload:
+    return Payload.intern(ans, hashlib.sha256(ans.encode()).digest())
+
+def answer_payload(ans: str) -> Payload:
+    """Payload for an answer, hashing each short answer once.
+
+    MCQ answers come from a handful of letters, so short answers go through
+    a bounded LRU cache; long free responses are hashed every time rather
+    than evicting them.
+    """
+    if len(ans) <= _INTERN_MAX_LEN:
+        return _cached_answer_payload(ans)
+    return Payload(ans, digest=hashlib.sha256(ans.encode()).digest())
+
 
 @dataclass
 class Transaction:
-    id: str
+    # Slotted: tens of thousands of these live in mempools and chains
+    __slots__ = ('id', 'timestamp', 'owner_pubkey', 'question_id', 'type', 'payload')
+    id: int  # 64-bit, see POKEngine._txn_id; ids from older state may be strings
     timestamp: float
     owner_pubkey: str
     question_id: str
     type: str
     payload: Payload
 
+    def __post_init__(self):
+        # Question ids, pubkeys and types repeat across every transaction
+        self.owner_pubkey = sys.intern(self.owner_pubkey)
+        self.question_id = sys.intern(self.question_id)
+        self.type = sys.intern(self.type)
+
 @dataclass
 class Block:
     hash: str
     txns: List[Transaction]
     type: str
+    prev_hash: str = ""
+
+    @classmethod
+    def create(cls, txns: List[Transaction], block_type: str, prev_hash: str) -> 'Block':
+        """Builds a content-addressed block linked to its parent's hash."""
+        # Fields are JSON-encoded so client strings containing a separator
+        # cannot make two different blocks hash alike.
+        h = hashlib.sha256(json.dumps([prev_hash, block_type]).encode())
+        for txn in txns:
+            h.update(json.dumps([
+                txn.id, txn.owner_pubkey, txn.question_id, txn.type, txn.timestamp, txn.payload.hash,
+            ]).encode())
+        return cls(h.hexdigest(), txns, block_type, prev_hash)
 
 @dataclass
 class Question:
@@ -40,133 +135,1967 @@ class Question:
     choices: List[Dict[str, str]]
     answer_key: Optional[str]
 
+
+_QTYPES = {'multiple-choice': 'mcq'}  # curriculum.json spelling -> engine/frontend spelling
+
+def _answer_key(record: Dict) -> Optional[str]:
+    # Current exports keep the key at the top level, older ones under attachments
+    key = record.get('answerKey', record.get('attachments', {}).get('answerKey'))
+    return None if key is None else str(key)
+
+
+class Curriculum:
+    """Questions in curriculum order, indexed by id.
+
+    Records are parsed once into plain dicts. The Question (prompt, choices
+    and the rest of the attachments) is built on first access, so loading
+    costs one json.load plus an id index. Each MCQ's answer-key digest is
+    computed up front so grading compares 32-byte digests.
+    """
+
+    def __init__(self, records: List[Dict]):
+        self._records = records
+        self._questions: List[Optional[Question]] = [None] * len(records)
+        self._index: Dict[str, int] = {record.get('id'): i for i, record in enumerate(records)}
+        self._json: Optional[Tuple[bytes, str]] = None
+        self.answer_digests: Dict[str, bytes] = {}
+        for record in records:
+            key = _answer_key(record)
+            if key is not None:
+                self.answer_digests[record.get('id')] = answer_payload(key).digest
+
+    @classmethod
+    def load(cls, file_path: str) -> 'Curriculum':
+        try:
+            with open(file_path, 'r') as f:
+                return cls(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls([])
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, i: int) -> Question:
+        question = self._questions[i]
+        if question is None:
+            record = self._records[i]
+            qtype = record.get('type', 'mcq')
+            question = Question(
+                id=record.get('id'),
+                prompt=record.get('prompt'),
+                qtype=_QTYPES.get(qtype, qtype),
+                choices=record.get('attachments', {}).get('choices', []),
+                answer_key=_answer_key(record),
+            )
+            self._questions[i] = question
+        return question
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self._records)))
+
+    def __contains__(self, qid: str) -> bool:
+        return qid in self._index
+
+    def get(self, qid: str) -> Optional[Question]:
+        i = self._index.get(qid)
+        return None if i is None else self[i]
+
+    def answer_digest(self, qid: str) -> Optional[bytes]:
+        return self.answer_digests.get(qid)
+
+    def json_body(self) -> Tuple[bytes, str]:
+        """The serialized question list and its ETag, computed once."""
+        if self._json is None:
+            body = json.dumps([asdict(q) for q in self]).encode()
+            self._json = (body, hashlib.sha256(body).hexdigest()[:32])
+        return self._json
+
+_ID_MASK = (1 << 64) - 1
+
+def _id_digest(txn_id) -> int:
+    """Stable 64-bit digest of a transaction id for mempool set digests."""
+    if isinstance(txn_id, int):
+        return txn_id  # Already a uniformly distributed 64-bit hash
+    return int.from_bytes(hashlib.blake2b(txn_id.encode(), digest_size=8).digest(), 'big')
+
+
+class Mempool:
+    """Insertion-ordered, id-keyed set of pending transactions.
+
+    Duplicate ids are ignored and removal by id is O(1), so mining never
+    rebuilds the whole pool. Each question bucket keeps a (count, xor of id
+    digests) summary, and the pool keeps one overall, letting two peers find
+    the buckets they disagree on without listing every transaction.
+
+    Each transaction also gets an increasing insertion number. The sorted
+    list of them (removed ones are skipped, and dropped once they outnumber
+    the live ones) lets page() find its cursor by binary search.
+    """
+
+    def __init__(self, txns=(), on_add=None, on_remove=None):
+        self._txns: Dict[int, Transaction] = {}
+        self._positions: Dict[int, int] = {}  # txn id -> insertion number
+        self._order: List[int] = []  # Insertion numbers, ascending; may hold removed ones
+        self._by_position: Dict[int, Transaction] = {}
+        self._next_position = 0
+        self._buckets: Dict[str, Dict[int, Transaction]] = {}
+        self._bucket_digests: Dict[str, tuple] = {}
+        self._digest = 0
+        self._on_add = on_add
+        self._on_remove = on_remove
+        self.extend(txns)
+
+    def __len__(self) -> int:
+        return len(self._txns)
+
+    def __iter__(self):
+        return iter(list(self._txns.values()))
+
+    def __contains__(self, txn) -> bool:
+        return (txn.id if isinstance(txn, Transaction) else txn) in self._txns
+
+    def __repr__(self) -> str:
+        return f"Mempool({list(self._txns.values())!r})"
+
+    def _toggle(self, txn: Transaction, delta: int):
+        d = _id_digest(txn.id)
+        self._digest ^= d
+        count, xor = self._bucket_digests.get(txn.question_id, (0, 0))
+        if count + delta:
+            self._bucket_digests[txn.question_id] = (count + delta, xor ^ d)
+        else:
+            del self._bucket_digests[txn.question_id]
+
+    def append(self, txn: Transaction):
+        self.extend([txn])
+
+    def extend(self, txns) -> List[Transaction]:
+        """Adds transactions whose ids are new; returns the ones added."""
+        added = []
+        for txn in txns:
+            if txn.id in self._txns:
+                continue
+            self._txns[txn.id] = txn
+            self._positions[txn.id] = self._next_position
+            self._order.append(self._next_position)
+            self._by_position[self._next_position] = txn
+            self._next_position += 1
+            self._buckets.setdefault(txn.question_id, {})[txn.id] = txn
+            self._toggle(txn, 1)
+            added.append(txn)
+        if self._on_add and added:
+            self._on_add(added)
+        return added
+
+    def __iadd__(self, txns):
+        self.extend(txns)
+        return self
+
+    def remove(self, txn: Transaction):
+        if not self.discard_ids([txn.id]):
+            raise ValueError(f"{txn.id} not in mempool")
+
+    def discard_ids(self, txn_ids) -> List[Transaction]:
+        """Removes the given ids where present; returns the removed transactions."""
+        removed = []
+        for txn_id in txn_ids:
+            txn = self._txns.pop(txn_id, None)
+            if txn is None:
+                continue
+            del self._by_position[self._positions.pop(txn_id)]
+            bucket = self._buckets[txn.question_id]
+            del bucket[txn_id]
+            if not bucket:
+                del self._buckets[txn.question_id]
+            self._toggle(txn, -1)
+            removed.append(txn)
+        if len(self._order) > 2 * len(self._by_position) + 64:
+            self._order = [p for p in self._order if p in self._by_position]
+        if self._on_remove and removed:
+            self._on_remove(removed)
+        return removed
+
+    def clear(self):
+        self.discard_ids(list(self._txns))
+
+    def get(self, txn_id: int) -> Optional[Transaction]:
+        return self._txns.get(txn_id)
+
+    def page(self, after_id=None, limit: Optional[int] = None) -> List[Transaction]:
+        """Up to limit transactions following after_id, in insertion order.
+
+        Raises KeyError if after_id is no longer pending.
+        """
+        if after_id is None:
+            start = 0
+        else:
+            if after_id not in self._txns:
+                raise KeyError(after_id)
+            start = bisect.bisect_right(self._order, self._positions[after_id])
+        txns = []
+        for i in range(start, len(self._order)):
+            if limit is not None and len(txns) == limit:
+                break
+            txn = self._by_position.get(self._order[i])
+            if txn is not None:
+                txns.append(txn)
+        return txns
+
+    def bucket(self, qid: str) -> Dict[int, Transaction]:
+        """Pending transactions for one question, keyed by id."""
+        return self._buckets.get(qid, {})
+
+    @property
+    def digest(self) -> tuple:
+        return (len(self._txns), self._digest)
+
+    @property
+    def bucket_digests(self) -> Dict[str, tuple]:
+        return self._bucket_digests
+
+    def missing_from(self, other: 'Mempool') -> List[Transaction]:
+        """Transactions in other that this pool lacks, comparing digests first."""
+        if self.digest == other.digest:
+            return []
+        ours, theirs = self._bucket_digests, other.bucket_digests
+        missing = []
+        for qid, summary in theirs.items():
+            if ours.get(qid) != summary:
+                missing.extend(
+                    txn for txn_id, txn in other.bucket(qid).items()
+                    if txn_id not in self._txns
+                )
+        return missing
+
+
+def _skip_height(height: int) -> int:
+    """Height a chain cell's skip pointer targets (same scheme as Bitcoin's pskip)."""
+    if height < 2:
+        return 0
+    invert_lowest_one = lambda n: n & (n - 1)
+    if height & 1:
+        return invert_lowest_one(invert_lowest_one(height - 1)) + 1
+    return invert_lowest_one(height)
+
+
+class Chain:
+    """Immutable, structurally shared block chain (a persistent linked list).
+
+    A Chain value is a tip pointer: the newest block, the chain it extends and
+    the resulting length. Extending allocates one cell, adopting a peer's chain
+    is a reference assignment, and nodes that agree on history share its cells.
+    Each cell also keeps a skip pointer to an older prefix so any prefix is
+    reachable in O(log n) steps.
+    """
+    __slots__ = ('block', 'parent', 'length', 'skip')
+
+    def __init__(self, block: Optional[Block] = None, parent: Optional['Chain'] = None):
+        self.block = block
+        self.parent = parent
+        self.length = 0 if block is None else parent.length + 1
+        self.skip = parent.at(_skip_height(self.length)) if parent is not None else None
+
+    @classmethod
+    def from_blocks(cls, blocks) -> 'Chain':
+        chain = cls()
+        for block in blocks:
+            chain = chain.with_block(block)
+        return chain
+
+    def with_block(self, block: Block) -> 'Chain':
+        return Chain(block, self)
+
+    @property
+    def tip_hash(self) -> str:
+        return self.block.hash if self.length else ""
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _cells(self):
+        cell = self
+        while cell.length:
+            yield cell
+            cell = cell.parent
+
+    def __iter__(self):
+        return iter(reversed([cell.block for cell in self._cells()]))
+
+    def __reversed__(self):
+        return (cell.block for cell in self._cells())
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('chain index out of range')
+        return self.at(i + 1).block
+
+    def __repr__(self) -> str:
+        return f"Chain(length={self.length}, tip={self.tip_hash[:12]!r})"
+
+    def at(self, height: int) -> 'Chain':
+        """The prefix of this chain with the given length, in O(log n) hops."""
+        if not 0 <= height <= self.length:
+            raise IndexError('chain height out of range')
+        cell = self
+        while cell.length > height:
+            skip_h = _skip_height(cell.length)
+            skip_prev_h = _skip_height(cell.length - 1)
+            if cell.skip is not None and (
+                skip_h == height
+                or (skip_h > height and not (skip_prev_h < skip_h - 2 and skip_prev_h >= height))
+            ):
+                cell = cell.skip
+            else:
+                cell = cell.parent
+        return cell
+
+    def fork_height(self, other: 'Chain') -> int:
+        """Length of the longest prefix both chains share.
+
+        Blocks are hash-linked, so two chains agree on every block below any
+        height where their block hashes match; that makes the fork point a
+        binary search over heights, O(log^2 n) hash probes in the worst case.
+        """
+        lo, hi = 0, min(self.length, other.length)
+        if self.at(hi).tip_hash == other.at(hi).tip_hash:
+            return hi
+        while lo < hi - 1:
+            mid = (lo + hi) // 2
+            if self.at(mid).tip_hash == other.at(mid).tip_hash:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def common_ancestor(self, other: 'Chain') -> 'Chain':
+        """Longest shared prefix, as a prefix of this chain."""
+        return self.at(self.fork_height(other))
+
+    def diff(self, other: 'Chain'):
+        """(fork height, blocks other has beyond it): what this chain is missing."""
+        height = self.fork_height(other)
+        return height, other.blocks_after(other.at(height))
+
+    def blocks_after(self, ancestor: 'Chain') -> List[Block]:
+        """Blocks on this chain above ancestor, oldest first."""
+        blocks = []
+        cell = self
+        while cell.length > ancestor.length:
+            blocks.append(cell.block)
+            cell = cell.parent
+        blocks.reverse()
+        return blocks
+
+
+class ConvergenceHistory:
+    """Timestamp-ordered attestations for one question.
+
+    Keeps one sorted timestamp list overall and one per answer digest, so the
+    share an answer held at any moment is two binary searches away.
+    """
+
+    def __init__(self):
+        self.timestamps: List[float] = []
+        self.txns: List[Transaction] = []
+        self.by_digest: Dict[bytes, List[float]] = {}
+
+    def add(self, txn: Transaction):
+        pos = bisect.bisect_right(self.timestamps, txn.timestamp)
+        self.timestamps.insert(pos, txn.timestamp)
+        self.txns.insert(pos, txn)
+        bisect.insort(self.by_digest.setdefault(txn.payload.digest, []), txn.timestamp)
+
+    def remove(self, txn: Transaction):
+        pos = self.txns.index(txn)
+        del self.timestamps[pos]
+        del self.txns[pos]
+        stamps = self.by_digest[txn.payload.digest]
+        del stamps[bisect.bisect_left(stamps, txn.timestamp)]
+
+    def proportion_at(self, timestamp: float, ans_digest: bytes) -> float:
+        """Share of ans_digest among attestations made strictly before timestamp."""
+        total = bisect.bisect_left(self.timestamps, timestamp)
+        if total == 0:
+            return 0.0
+        return bisect.bisect_left(self.by_digest.get(ans_digest, []), timestamp) / total
+
+
+class QuestionIndex:
+    """Incremental question_id index over a node's visible attestations.
+
+    Covers every attestation/ap_reveal in the node's mempool and chain (counted
+    once per occurrence, like a rescan of ``mempool + chain`` would), with
+    per-question attestation counts, unweighted per-answer-hash tallies and a
+    ConvergenceHistory of plain attestations. Tallies only include attesters
+    known to the engine; new entries wait in ``_pending`` until the first
+    lookup checks them against the node registry. ``convergence`` holds the
+    engine's memoized results per question, dropped whenever that
+    question's attestations change (see POKEngine.calculate_convergence).
+    """
+    TRACKED_TYPES = ("attestation", "ap_reveal")
+
+    def __init__(self):
+        self.txns: Dict[str, List[Transaction]] = {}
+        self.attestation_counts: Dict[str, int] = {}
+        self.tallies: Dict[str, Dict[bytes, float]] = {}
+        self.history: Dict[str, ConvergenceHistory] = {}
+        self.convergence: Dict[str, Dict[bool, Tuple[int, float]]] = {}  # qid -> weighted -> (epoch, value)
+        self._pending: Dict[str, List[Transaction]] = {}
+
+    @staticmethod
+    def weight(txn: Transaction) -> float:
+        return 10.0 if txn.type == "ap_reveal" else 1.0
+
+    def add(self, txns):
+        for txn in txns:
+            if txn.type not in self.TRACKED_TYPES:
+                continue
+            qid = txn.question_id
+            self.convergence.pop(qid, None)
+            self.txns.setdefault(qid, []).append(txn)
+            self._pending.setdefault(qid, []).append(txn)
+            if txn.type == "attestation":
+                self.attestation_counts[qid] = self.attestation_counts.get(qid, 0) + 1
+                self.history.setdefault(qid, ConvergenceHistory()).add(txn)
+
+    def remove(self, txns):
+        for txn in txns:
+            if txn.type not in self.TRACKED_TYPES:
+                continue
+            qid = txn.question_id
+            self.convergence.pop(qid, None)
+            self.txns[qid].remove(txn)
+            if txn.type == "attestation":
+                self.attestation_counts[qid] -= 1
+                self.history[qid].remove(txn)
+            pending = self._pending.get(qid)
+            if pending and txn in pending:
+                pending.remove(txn)
+                continue
+            tally = self.tallies[qid]
+            tally[txn.payload.digest] -= self.weight(txn)
+            if tally[txn.payload.digest] <= 0:
+                del tally[txn.payload.digest]
+
+    def tally(self, qid: str, known_pubkeys) -> Dict[bytes, float]:
+        """Returns the unweighted answer-digest tally for attesters in known_pubkeys."""
+        pending = self._pending.get(qid)
+        if pending:
+            tally = self.tallies.setdefault(qid, {})
+            unknown = []
+            for txn in pending:
+                if txn.owner_pubkey in known_pubkeys:
+                    tally[txn.payload.digest] = tally.get(txn.payload.digest, 0) + self.weight(txn)
+                else:
+                    unknown.append(txn)
+            self._pending[qid] = unknown
+        return self.tallies.get(qid, {})
+
+    def unknown_attesters(self, qid: str) -> set:
+        """Owners of entries the last tally left out as unknown to the engine."""
+        return {txn.owner_pubkey for txn in self._pending.get(qid, ())}
+
+
 @dataclass
 class Node:
     pubkey: str
     archetype: str
-    mempool: List[Transaction] = field(default_factory=list)
-    chain: List[Block] = field(default_factory=list)
+    mempool: Mempool = field(default_factory=Mempool)
+    chain: Chain = field(default_factory=Chain)
     progress: int = 0
     reputation: float = 1.0  # Start with 1.0 to avoid log(0) issues
     consensus_history: Dict = field(default_factory=dict)
 
+    def __post_init__(self):
+        # Guards this node's mempool, chain and progress; see POKEngine.node_locks
+        self.lock = threading.RLock()
+
+    @property
+    def question_index(self) -> QuestionIndex:
+        # Built on first use so a node restored from a snapshot does not
+        # decode its chain until something actually reads it.
+        index = self.__dict__.get('_index')
+        if index is None:
+            index = QuestionIndex()
+            index.add(self.mempool)
+            index.add(t for b in self.chain for t in b.txns)
+            object.__setattr__(self, '_index', index)
+        return index
+
+    def _index_add(self, txns):
+        index = self.__dict__.get('_index')
+        if index is not None:
+            index.add(txns)
+
+    def _index_remove(self, txns):
+        index = self.__dict__.get('_index')
+        if index is not None:
+            index.remove(txns)
+
+    def __setattr__(self, name, value):
+        # Keep question_index in step with the mempool and chain, including
+        # wholesale reassignment (node.mempool = [...]) and in-place edits.
+        if name in ('mempool', 'chain'):
+            index = self.__dict__.get('_index')
+            old = self.__dict__.get(name)
+            if name == 'mempool':
+                if old and index is not None:
+                    index.remove(old)
+                value = Mempool(value, on_add=self._index_add, on_remove=self._index_remove)
+            else:
+                if not isinstance(value, Chain):
+                    value = Chain.from_blocks(value)
+                if index is not None:
+                    # Only blocks above the fork point change what the node sees
+                    height, added = old.diff(value) if old else (0, list(value))
+                    if old:
+                        index.remove(t for b in old.blocks_after(old.at(height)) for t in b.txns)
+                    index.add(t for b in added for t in b.txns)
+        super().__setattr__(name, value)
+        if name == 'reputation':
+            # Tells the owning engine, whose memoized convergence may weigh it
+            listener = self.__dict__.get('_reputation_listener')
+            if listener is not None:
+                listener(self.pubkey)
+
+# --- SERIALIZATION HELPERS ---
+def txn_id_to_str(txn_id) -> str:
+    # Hex on the wire: JSON clients cannot hold a 64-bit integer exactly
+    return f"{txn_id:016x}" if isinstance(txn_id, int) else txn_id
+
+def txn_id_from_str(value: str):
+    if len(value) == 16:
+        try:
+            return int(value, 16)
+        except ValueError:
+            pass
+    return value  # Legacy "{t}-{pubkey[:5]}-{type}" id
+
+def txn_to_dict(txn: Transaction) -> Dict:
+    return {
+        'id': txn_id_to_str(txn.id),
+        'timestamp': txn.timestamp,
+        'owner_pubkey': txn.owner_pubkey,
+        'question_id': txn.question_id,
+        'type': txn.type,
+        'payload': {'answer': txn.payload.answer, 'hash': txn.payload.hash},
+    }
+
+def txn_from_dict(data: Dict) -> Transaction:
+    payload = data['payload']
+    return Transaction(
+        id=txn_id_from_str(data['id']),
+        timestamp=float(data['timestamp']),
+        owner_pubkey=data['owner_pubkey'],
+        question_id=data['question_id'],
+        type=data['type'],
+        payload=Payload.intern(payload['answer'], bytes.fromhex(payload['hash'])),
+    )
+
+def block_to_dict(block: Block) -> Dict:
+    return {
+        'hash': block.hash,
+        'txns': [txn_to_dict(txn) for txn in block.txns],
+        'type': block.type,
+        'prev_hash': block.prev_hash,
+    }
+
+def node_to_dict(node: Node) -> Dict:
+    return {
+        'pubkey': node.pubkey,
+        'archetype': node.archetype,
+        'mempool': [txn_to_dict(txn) for txn in node.mempool],
+        'chain': [block_to_dict(block) for block in node.chain],
+        'progress': node.progress,
+        'reputation': node.reputation,
+        'consensus_history': node.consensus_history,
+    }
+
+NODE_FIELDS = ('pubkey', 'archetype', 'mempool', 'chain', 'progress', 'reputation', 'consensus_history')
+
+
+class StaleCursor(ValueError):
+    """A page cursor that no longer points into the node's chain or mempool."""
+
+
+def chain_page(chain: Chain, cursor: Optional[str], limit: int) -> Tuple[List[Block], str, bool]:
+    """(up to limit blocks after cursor, cursor of the last one, more pending).
+
+    Chain cursors are "<height>:<block hash>". Blocks are hash-linked, so if
+    that block is no longer at that height the node adopted another chain
+    and the cursor is stale.
+    """
+    start, tip_hash = 0, ""
+    if cursor:
+        height, _, tip_hash = cursor.partition(':')
+        try:
+            start = int(height)
+        except ValueError:
+            raise ValueError(f"Malformed chain cursor {cursor!r}")
+    if not 0 <= start <= len(chain) or chain.at(start).tip_hash != tip_hash:
+        raise StaleCursor("Chain cursor is no longer on this node's chain")
+    end = min(start + limit, len(chain))
+    top = chain.at(end)
+    return top.blocks_after(chain.at(start)), f"{end}:{top.tip_hash}", end < len(chain)
+
+
+def node_state(
+    node: Node,
+    fields=NODE_FIELDS,
+    limit: Optional[int] = None,
+    chain_cursor: Optional[str] = None,
+    mempool_cursor: Optional[str] = None,
+) -> Dict:
+    """node_to_dict restricted to fields, optionally paging chain and mempool.
+
+    With a limit, "page" maps each paged list to the cursor to continue
+    from and whether more items follow. Only requested fields are encoded.
+    """
+    state, page = {}, {}
+    for name in fields:
+        if name == 'chain':
+            if limit is None:
+                blocks = list(node.chain)
+            else:
+                blocks, cursor, more = chain_page(node.chain, chain_cursor, limit)
+                page['chain'] = {'cursor': cursor, 'more': more}
+            state['chain'] = [block_to_dict(block) for block in blocks]
+        elif name == 'mempool':
+            if limit is None:
+                txns = list(node.mempool)
+            else:
+                after = txn_id_from_str(mempool_cursor) if mempool_cursor else None
+                try:
+                    txns = node.mempool.page(after, limit + 1)
+                except KeyError:
+                    raise StaleCursor("Mempool cursor is no longer pending")
+                more = len(txns) > limit
+                txns = txns[:limit]
+                cursor = txn_id_to_str(txns[-1].id) if txns else mempool_cursor
+                page['mempool'] = {'cursor': cursor, 'more': more}
+            state['mempool'] = [txn_to_dict(txn) for txn in txns]
+        elif name == 'consensus_history':
+            state[name] = dict(node.consensus_history)
+        else:
+            state[name] = getattr(node, name)
+    if page:
+        state['page'] = page
+    return state
+
+def block_from_dict(data: Dict) -> Block:
+    return Block(
+        hash=data['hash'],
+        txns=[txn_from_dict(txn) for txn in data['txns']],
+        type=data['type'],
+        prev_hash=data.get('prev_hash', ''),
+    )
+
+# --- GEVENT COMPATIBILITY ---
+# The Dockerfile serves on gevent workers, whose monkey-patching turns
+# threads into greenlets taking turns on one OS thread. Work that must not
+# hold that thread, or state that belongs to an OS thread, uses the originals.
+def _unpatched(module: str, name: str):
+    """module.name as it was before gevent monkey-patched it, if it did."""
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None:
+        return monkey.get_original(module, name)
+    return getattr(sys.modules[module], name)
+
+def _gevent_patched() -> bool:
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+def start_os_thread(target, name: str):
+    """Runs target on a new OS thread; returns a handle to join() it.
+
+    Under gevent a threading.Thread is a greenlet, so a CPU-bound target
+    would stall every request on the worker until it yielded.
+    """
+    if _gevent_patched():
+        from gevent.threadpool import ThreadPool
+        pool = ThreadPool(1)
+        pool.spawn(target)
+        return pool
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+# --- STATE STORES ---
+# When a store forces writes to stable storage:
+#   always    journal appends and every snapshot file
+#   snapshot  snapshot files only; journal appends survive a process crash
+#             but the latest may be lost on power failure
+#   never     nothing; atomic renames and checksums still keep a crash from
+#             leaving a damaged snapshot in use
+FSYNC_POLICIES = ('always', 'snapshot', 'never')
+
+class StateStore:
+    """Durable home of the engine's snapshot and event journal.
+
+    The engine keeps the working state in memory and persists it as a
+    snapshot plus the journal events recorded after it. Journal events carry
+    a ``seq`` assigned by the engine. A ``shared`` store may be written by
+    other processes, so engines using it catch up on new events before
+    serving a request and hold ``write_lock()`` around every mutation.
+    """
+    shared = False
+
+    def load_snapshot(self) -> Tuple[int, Optional[Dict]]:
+        """Returns (journal seq the snapshot covers, snapshot state or None).
+
+        A node's ``chain`` is a list of block dicts or an already built Chain.
+        """
+        raise NotImplementedError
+
+    def read_events(self, after_seq: int) -> Optional[List[Dict]]:
+        """Events with seq > after_seq in order, or None if some were compacted away."""
+        raise NotImplementedError
+
+    def append_events(self, events: List[Dict]):
+        """Appends events to the journal; if it raises, none of them is kept."""
+        raise NotImplementedError
+
+    def rotate(self):
+        """Called under the journal lock when a snapshot's view is captured."""
+
+    def partial_snapshots(self) -> bool:
+        """Whether the next snapshot may hold only the nodes changed since the last one."""
+        return False
+
+    def write_snapshot(self, seq: int, views, partial: bool = False):
+        """Persists node views (see POKEngine._capture_state) as of journal seq.
+
+        A partial snapshot's views are the changed nodes only; every other
+        node keeps its state from the previous snapshot.
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def write_lock(self):
+        yield
+
+    def size_bytes(self) -> int:
+        """Bytes the persisted state occupies."""
+        return 0
+
+
+class MemoryStateStore(StateStore):
+    """Persistence disabled: the engine starts empty and nothing is written.
+
+    For simulations and benchmarks that only need the in-memory engine.
+    """
+
+    def load_snapshot(self) -> Tuple[int, Optional[Dict]]:
+        return 0, None
+
+    def read_events(self, after_seq: int) -> Optional[List[Dict]]:
+        return []
+
+    def append_events(self, events: List[Dict]):
+        pass
+
+    def write_snapshot(self, seq: int, views, partial: bool = False):
+        pass
+
+
+class _LazyChain(Chain):
+    """Chain tip restored from a snapshot whose blocks are decoded on first use.
+
+    Only ``length`` is known up front. The first read of any other slot
+    decodes the chain and fills the slots in, after which the cell behaves
+    exactly like the Chain it stands for.
+    """
+    __slots__ = ('_load',)
+
+    def __init__(self, length: int, load):
+        self.length = length
+        self._load = load
+
+    def __getattr__(self, name):
+        # Only reached while a slot is still unset, i.e. before the first load
+        if name not in ('block', 'parent', 'skip'):
+            raise AttributeError(name)
+        tip = self._load()
+        self.block, self.parent, self.skip = tip.block, tip.parent, tip.skip
+        return getattr(self, name)
+
+
+class BlockLog:
+    """Append-only file of the blocks of every node's chain.
+
+    A block is appended the first time a snapshot reaches it and never
+    rewritten, so a snapshot only writes the blocks mined or adopted since
+    the previous one. A block record is a length prefix, the offset of the
+    parent block's record (0 for the genesis parent), then the block's JSON.
+    Chains restored from the log are decoded lazily through a memory map of
+    the log as it was when opened; decoded cells are cached by offset so
+    chains sharing history share cells again. ``crc`` is the running CRC-32
+    of the whole log, which a manifest records with the log's size to
+    verify it on load.
+    """
+    MAGIC = b'POKBLKS\0'
+    VERSION = 1
+    HEADER = struct.Struct('<8sH')  # magic, version
+    LENGTH = struct.Struct('<I')
+    PARENT = struct.Struct('<Q')  # Offset 0 is the file header, so it marks the genesis parent
+
+    def __init__(self, path: str, size: Optional[int] = None, crc: Optional[int] = None):
+        """Opens the log at path, cutting off bytes past size; a new log if size is None.
+
+        Raises CorruptSnapshot if the first size bytes do not match crc.
+        """
+        self._cells: Dict[int, Chain] = {0: Chain()}
+        self._lock = threading.Lock()
+        self.path = path
+        with open(path, 'wb' if size is None else 'r+b') as f:
+            if size is None:
+                f.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+            elif os.fstat(f.fileno()).st_size < size:
+                raise CorruptSnapshot(f"{path} is shorter than its manifest says")
+            else:
+                f.truncate(size)  # Blocks of a snapshot that never committed
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.crc = zlib.crc32(self._map)
+        if crc is not None and self.crc != crc:
+            raise CorruptSnapshot(f"{path} does not match its checksum")
+        magic, version = self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise CorruptSnapshot(f"{path} is not a version {self.VERSION} block log")
+        self.size = len(self._map)
+        self._offsets: Dict[str, int] = {}  # block hash -> record offset
+        self._tips: Dict[int, Tuple[int, Chain]] = {}  # id(lazy tip) -> (offset, tip)
+
+    def _record(self, offset: int) -> bytes:
+        (length,) = self.LENGTH.unpack_from(self._map, offset)
+        start = offset + self.LENGTH.size
+        return self._map[start:start + length]
+
+    def chain(self, offset: int, length: int) -> Chain:
+        if not length:
+            return Chain()
+        tip = _LazyChain(length, lambda: self._load_chain(offset))
+        # Keeps the offset findable without decoding the chain
+        self._tips[id(tip)] = (offset, tip)
+        return tip
+
+    def _load_chain(self, offset: int) -> Chain:
+        with self._lock:
+            # Walk back to the newest cell already decoded, then rebuild forward
+            pending = []
+            while offset not in self._cells:
+                record = self._record(offset)
+                (parent,) = self.PARENT.unpack_from(record)
+                pending.append((offset, record))
+                offset = parent
+            chain = self._cells[offset]
+            for offset, record in reversed(pending):
+                chain = chain.with_block(block_from_dict(json.loads(record[self.PARENT.size:])))
+                self._cells[offset] = chain
+                self._offsets[chain.block.hash] = offset
+            return chain
+
+    def _offset_of(self, cell: Chain) -> Optional[int]:
+        if not cell.length:
+            return 0
+        tip = self._tips.get(id(cell))
+        if tip is not None and tip[1] is cell:
+            return tip[0]
+        return self._offsets.get(cell.block.hash)
+
+    def append_chain(self, f, chain: Chain) -> int:
+        """Writes chain's blocks that are not in the log yet to f; returns the tip's offset."""
+        fresh = []
+        offset = self._offset_of(chain)
+        while offset is None:
+            fresh.append(chain)
+            chain = chain.parent
+            offset = self._offset_of(chain)
+        for cell in reversed(fresh):
+            record = self.PARENT.pack(offset) + json.dumps(block_to_dict(cell.block), default=str).encode()
+            offset = self.size
+            data = self.LENGTH.pack(len(record)) + record
+            f.write(data)
+            self.size += len(data)
+            self.crc = zlib.crc32(data, self.crc)
+            self._offsets[cell.block.hash] = offset
+        return offset
+
+
+class CorruptSnapshot(ValueError):
+    """A snapshot file that is truncated or does not match its checksum."""
+
+
+CHECKED_HEADER = struct.Struct('<II')  # CRC-32 and length of the payload that follows
+
+def write_checked(path: str, payload: bytes, sync: bool = True):
+    """Writes payload behind a checksummed header, fsyncing it if sync."""
+    with open(path, 'wb') as f:
+        f.write(CHECKED_HEADER.pack(zlib.crc32(payload), len(payload)) + payload)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+def read_checked(path: str) -> bytes:
+    """Payload of a file written by write_checked; raises CorruptSnapshot if damaged."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < CHECKED_HEADER.size:
+        raise CorruptSnapshot(f"{path} is truncated")
+    crc, length = CHECKED_HEADER.unpack_from(data)
+    payload = data[CHECKED_HEADER.size:]
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        raise CorruptSnapshot(f"{path} does not match its checksum")
+    return payload
+
+def _fsync_dir(path: str):
+    # Makes renames and new entries in the directory durable
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FileStateStore(StateStore):
+    """Per-node snapshot files plus a JSON-lines journal on the local filesystem.
+
+    The snapshot is a directory next to ``state_file`` (``<base>.state``)
+    holding a BlockLog shared by all chains, one file per node with its
+    header fields, mempool and chain tip, and a MANIFEST naming the current
+    file of every node. A partial snapshot appends new blocks, writes new
+    files for the changed nodes only and commits by atomically replacing
+    the MANIFEST, so its cost follows the change rather than the class.
+    Every ``full_every``-th snapshot rewrites everything into a fresh block
+    log, which drops the blocks of abandoned forks.
+
+    Node files and the MANIFEST carry a checksummed header and the MANIFEST
+    records the block log's size and CRC, so a damaged snapshot is detected
+    on load. The previous MANIFEST (``MANIFEST.prev``), its files and the
+    journal written since it are kept until the next snapshot commits;
+    loading falls back to them when the current snapshot is damaged. When
+    the journal rotates, its events are kept in a segment
+    (``<base>.journal.<generation>``) named after the snapshot that covers them.
+    ``fsync`` is one of FSYNC_POLICIES.
+
+    The JSON state at ``state_file`` written by earlier versions is still
+    read until the first snapshot replaces it.
+    Single-process only: concurrent writers in other processes are not seen.
+    """
+
+    def __init__(self, state_file: str, full_every: int = 100, fsync: str = 'always'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.state_file = state_file
+        base = os.path.splitext(state_file)[0]
+        self.snapshot_dir = base + '.state'
+        self.manifest_file = os.path.join(self.snapshot_dir, 'MANIFEST')
+        self.previous_manifest_file = self.manifest_file + '.prev'
+        self.journal_file = base + '.journal'
+        self.full_every = full_every
+        self.fsync = fsync
+        self._manifest: Optional[Dict] = None
+        self._previous: Optional[Dict] = None  # Manifest kept to fall back to
+        self._blocks: Optional[BlockLog] = None
+        self._partials = 0  # Partial snapshots since the last full one
+
+    def load_snapshot(self) -> Tuple[int, Optional[Dict]]:
+        damaged = []
+        for path in (self.manifest_file, self.previous_manifest_file):
+            if not os.path.exists(path):
+                continue
+            try:
+                seq, state = self._load_manifest(path)
+            except (ValueError, KeyError, OSError, struct.error) as e:
+                damaged.append(str(e))
+                continue
+            if path != self.manifest_file:
+                if damaged:
+                    sys.stderr.write(f"Skipped damaged snapshot ({damaged[0]}); restored the previous one\n")
+                # The intact snapshot becomes current, so the next commit keeps it
+                # as the fallback. Without damage, a crash between the two renames
+                # of a commit left MANIFEST missing.
+                os.replace(path, self.manifest_file)
+                self._previous = None
+            self._remove_unreferenced()
+            return seq, state
+        if damaged:
+            raise CorruptSnapshot(f"No intact snapshot in {self.snapshot_dir}: {'; '.join(damaged)}")
+        if not os.path.exists(self.state_file):
+            return 0, None
+        with open(self.state_file, 'r') as f:
+            state = json.load(f)
+        return state.get('journal_seq', 0), state
+
+    def _load_manifest(self, path: str) -> Tuple[int, Dict]:
+        manifest = json.loads(read_checked(path))
+        blocks = BlockLog(self._path(manifest['blocks']), manifest['blocks_size'], manifest['blocks_crc'])
+        nodes = {}
+        for pubkey, name in manifest['nodes'].items():
+            node_data = json.loads(read_checked(self._path(name)))
+            node_data['chain'] = blocks.chain(node_data.pop('chain_offset'), node_data.pop('chain_length'))
+            nodes[pubkey] = node_data
+        self._manifest, self._blocks = manifest, blocks
+        if path == self.manifest_file and os.path.exists(self.previous_manifest_file):
+            try:
+                self._previous = json.loads(read_checked(self.previous_manifest_file))
+            except (ValueError, OSError):
+                self._previous = None  # Nothing to fall back to, but the current snapshot is fine
+        return manifest['journal_seq'], {'journal_seq': manifest['journal_seq'], 'nodes': nodes}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.snapshot_dir, name)
+
+    def _referenced(self) -> set:
+        referenced = set()
+        for manifest, name in ((self._manifest, 'MANIFEST'), (self._previous, 'MANIFEST.prev')):
+            if manifest is not None:
+                referenced.update((name, manifest['blocks'], *manifest['nodes'].values()))
+        return referenced
+
+    def _remove_unreferenced(self):
+        # Files of superseded or never committed snapshots
+        referenced = self._referenced()
+        for name in os.listdir(self.snapshot_dir):
+            if name not in referenced:
+                os.remove(self._path(name))
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        """(generation, path) of the rotated journal segments, oldest first."""
+        directory = os.path.dirname(self.journal_file) or '.'
+        prefix = os.path.basename(self.journal_file) + '.'
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            (int(name[len(prefix):]), os.path.join(directory, name))
+            for name in os.listdir(directory)
+            if name.startswith(prefix) and name[len(prefix):].isdigit()
+        )
+
+    def read_events(self, after_seq: int) -> Optional[List[Dict]]:
+        events = []
+        journal_files = [*(path for _, path in self._segments()), self.journal_file]
+        for journal_file in journal_files:
+            if not os.path.exists(journal_file):
+                continue
+            with open(journal_file, 'r+b') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError
+                        event = json.loads(line)
+                    except ValueError:
+                        # Torn final record from a crash mid-append; it was never
+                        # acknowledged. Cut it off so the next append starts clean.
+                        f.truncate(offset)
+                        break
+                    offset += len(line)
+                    if event['seq'] > after_seq:
+                        events.append(event)
+        return events
+
+    def append_events(self, events: List[Dict]):
+        os.makedirs(os.path.dirname(self.journal_file) or '.', exist_ok=True)
+        data = ''.join(json.dumps(event, default=str) + '\n' for event in events).encode()
+        # Unbuffered, so nothing of a failed append is left to flush on close
+        with open(self.journal_file, 'ab', buffering=0) as f:
+            start = f.tell()
+            try:
+                if f.write(data) != len(data):
+                    raise OSError(f"Short write to {self.journal_file}")
+                if self.fsync == 'always':
+                    os.fsync(f.fileno())
+            except BaseException:
+                f.truncate(start)
+                raise
+
+    def rotate(self):
+        # Events appended while the snapshot is written go to a fresh journal;
+        # the rotated ones are named after the snapshot about to cover them.
+        if not os.path.exists(self.journal_file):
+            return
+        generation = self._manifest['generation'] + 1 if self._manifest else 1
+        segment = f'{self.journal_file}.{generation}'
+        if os.path.exists(segment):
+            # That snapshot failed last time; its segment grows
+            with open(self.journal_file, 'rb') as src, open(segment, 'ab') as dst:
+                dst.write(src.read())
+            os.remove(self.journal_file)
+        else:
+            os.replace(self.journal_file, segment)
+
+    def partial_snapshots(self) -> bool:
+        return self._manifest is not None and self._partials < self.full_every - 1
+
+    def size_bytes(self) -> int:
+        paths = [self.journal_file, self.state_file]
+        paths += [path for _, path in self._segments()]
+        if os.path.isdir(self.snapshot_dir):
+            paths += [self._path(name) for name in os.listdir(self.snapshot_dir)]
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+    def write_snapshot(self, seq: int, views, partial: bool = False):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        try:
+            manifest, blocks = self._write_files(seq, views, partial)
+        except BaseException:
+            # The block log may hold part of a record; start over from a fresh one
+            self._partials = self.full_every
+            raise
+
+        sync = self.fsync != 'never'
+        tmp_path = self.manifest_file + '.tmp'
+        write_checked(tmp_path, json.dumps(manifest).encode(), sync)
+        if os.path.exists(self.manifest_file):
+            os.replace(self.manifest_file, self.previous_manifest_file)
+        os.replace(tmp_path, self.manifest_file)  # The commit point
+        if sync:
+            _fsync_dir(self.snapshot_dir)
+        superseded = self._referenced()
+        self._previous, self._manifest, self._blocks = self._manifest, manifest, blocks
+        self._partials = self._partials + 1 if partial else 0
+
+        for name in superseded - self._referenced():
+            os.remove(self._path(name))
+        if not partial and os.path.exists(self.state_file):
+            os.remove(self.state_file)
+        # Replaying from the fallback snapshot needs only the segments after it
+        keep_after = self._previous['generation'] if self._previous else manifest['generation']
+        for generation, path in self._segments():
+            if generation <= keep_after:
+                os.remove(path)
+
+    def _write_files(self, seq: int, views, partial: bool) -> Tuple[Dict, BlockLog]:
+        """Writes the block log and node files of a snapshot; returns its manifest and log."""
+        sync = self.fsync != 'never'
+        # New names every generation: committed files are never overwritten
+        generation = self._manifest['generation'] + 1 if self._manifest else 1
+        if partial:
+            blocks, nodes = self._blocks, dict(self._manifest['nodes'])
+        else:
+            blocks, nodes = BlockLog(self._path(f'blocks-{generation}.log')), {}
+        with open(blocks.path, 'ab') as log:
+            for view in views:
+                chain_offset = blocks.append_chain(log, view.chain)
+                name = f"{hashlib.sha256(view.pubkey.encode()).hexdigest()[:24]}-{generation}.node"
+                # dumps, not dump: dump streams through the pure-Python encoder
+                write_checked(self._path(name), json.dumps({
+                    'pubkey': view.pubkey,
+                    'archetype': view.archetype,
+                    'progress': view.progress,
+                    'reputation': view.reputation,
+                    'consensus_history': view.consensus_history,
+                    'chain_offset': chain_offset,
+                    'chain_length': len(view.chain),
+                    'mempool': [txn_to_dict(txn) for txn in view.mempool],
+                }, default=str).encode(), sync)
+                nodes[view.pubkey] = name
+            if sync:
+                log.flush()
+                os.fsync(log.fileno())
+        manifest = {
+            'generation': generation,
+            'journal_seq': seq,
+            'blocks': os.path.basename(blocks.path),
+            'blocks_size': blocks.size,
+            'blocks_crc': blocks.crc,
+            'nodes': nodes,
+        }
+        return manifest, blocks
+
+
+class SQLiteStateStore(StateStore):
+    """SQLite store in WAL mode that several worker processes can share.
+
+    Writers serialize on ``BEGIN IMMEDIATE``; each engine replays the journal
+    rows other processes committed since its last request. Compaction keeps
+    ``keep_events`` rows behind the snapshot so lagging workers can usually
+    catch up by replay rather than a full reload.
+
+    The snapshot is keyed: a row per node and a row per block, so a partial
+    snapshot rewrites the changed nodes and inserts only unseen blocks.
+    Every ``full_every``-th snapshot a process writes is a full rewrite,
+    which drops the blocks of abandoned forks. ``fsync`` (see
+    FSYNC_POLICIES) sets SQLite's synchronous mode; commits are atomic
+    under every policy.
+    """
+    shared = True
+    SYNCHRONOUS = {'always': 'FULL', 'snapshot': 'NORMAL', 'never': 'OFF'}
+
+    def __init__(self, path: str, keep_events: int = 1000, full_every: int = 100, fsync: str = 'snapshot'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = path
+        self.fsync = fsync
+        self.keep_events = keep_events
+        self.full_every = full_every
+        self._partials = 0  # Partial snapshots this process wrote since its last full one
+        # One connection per OS thread. Under gevent threading.local is per
+        # greenlet, which would open a connection per request; greenlets on
+        # one thread take turns on it under the engine's _refresh_lock.
+        self._local = _unpatched('threading', 'local')()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._conn()
+        conn.execute('CREATE TABLE IF NOT EXISTS journal (seq INTEGER PRIMARY KEY, event TEXT NOT NULL)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS snapshot '
+            '(id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL, state TEXT NOT NULL)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS snapshot_nodes (pubkey TEXT PRIMARY KEY, state TEXT NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS snapshot_blocks (hash TEXT PRIMARY KEY, block TEXT NOT NULL)')
+
+    def size_bytes(self) -> int:
+        paths = (self.path, self.path + '-wal')
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={self.SYNCHRONOUS[self.fsync]}')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def write_lock(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def load_snapshot(self) -> Tuple[int, Optional[Dict]]:
+        conn = self._conn()
+        row = conn.execute('SELECT seq FROM snapshot WHERE id = 1').fetchone()
+        if not row:
+            return 0, None
+        blocks = {block_hash: json.loads(block) for block_hash, block in conn.execute(
+            'SELECT hash, block FROM snapshot_blocks')}
+        nodes = {}
+        for pubkey, node_state in conn.execute('SELECT pubkey, state FROM snapshot_nodes'):
+            node_data = json.loads(node_state)
+            chain, tip_hash = [], node_data.pop('tip_hash')
+            while tip_hash:
+                chain.append(blocks[tip_hash])
+                tip_hash = chain[-1]['prev_hash']
+            node_data['chain'] = chain[::-1]
+            nodes[pubkey] = node_data
+        return row[0], {'journal_seq': row[0], 'nodes': nodes}
+
+    def partial_snapshots(self) -> bool:
+        if self._partials >= self.full_every - 1:
+            return False
+        return self._conn().execute('SELECT 1 FROM snapshot WHERE id = 1').fetchone() is not None
+
+    def read_events(self, after_seq: int) -> Optional[List[Dict]]:
+        conn = self._conn()
+        rows = conn.execute(
+            'SELECT seq, event FROM journal WHERE seq > ? ORDER BY seq', (after_seq,)
+        ).fetchall()
+        if rows and rows[0][0] != after_seq + 1:
+            return None
+        if not rows:
+            snapshot = conn.execute('SELECT seq FROM snapshot WHERE id = 1').fetchone()
+            if snapshot and snapshot[0] > after_seq:
+                return None
+        return [json.loads(event) for _, event in rows]
+
+    def append_events(self, events: List[Dict]):
+        self._conn().executemany(
+            'INSERT INTO journal (seq, event) VALUES (?, ?)',
+            [(event['seq'], json.dumps(event, default=str)) for event in events],
+        )
+
+    def write_snapshot(self, seq: int, views, partial: bool = False):
+        conn = self._conn()
+        if not partial:
+            conn.execute('DELETE FROM snapshot_nodes')
+            conn.execute('DELETE FROM snapshot_blocks')
+        seen = set()
+        for view in views:
+            # Walk back to the first block an earlier snapshot or view stored
+            for cell in view.chain._cells():
+                block_hash = cell.block.hash
+                if block_hash in seen:
+                    break
+                seen.add(block_hash)
+                if partial and conn.execute(
+                        'SELECT 1 FROM snapshot_blocks WHERE hash = ?', (block_hash,)).fetchone():
+                    break
+                conn.execute(
+                    'INSERT OR REPLACE INTO snapshot_blocks (hash, block) VALUES (?, ?)',
+                    (block_hash, json.dumps(block_to_dict(cell.block), default=str)),
+                )
+            node_state = {
+                'pubkey': view.pubkey,
+                'archetype': view.archetype,
+                'mempool': [txn_to_dict(txn) for txn in view.mempool],
+                'tip_hash': view.chain.tip_hash,
+                'progress': view.progress,
+                'reputation': view.reputation,
+                'consensus_history': view.consensus_history,
+            }
+            conn.execute(
+                'INSERT OR REPLACE INTO snapshot_nodes (pubkey, state) VALUES (?, ?)',
+                (view.pubkey, json.dumps(node_state, default=str)),
+            )
+        conn.execute(
+            'INSERT OR REPLACE INTO snapshot (id, seq, state) VALUES (1, ?, ?)',
+            (seq, json.dumps({'journal_seq': seq})),
+        )
+        conn.execute('DELETE FROM journal WHERE seq <= ?', (seq - self.keep_events,))
+        self._partials = self._partials + 1 if partial else 0
+
+
+def open_store(url: Optional[str], state_file: str = 'data/app_state.json', fsync: Optional[str] = None) -> StateStore:
+    """Builds a store from a URL such as ``sqlite:///data/app_state.db``.
+
+    An empty URL keeps the default single-process file store; ``memory://``
+    disables persistence. fsync, one of FSYNC_POLICIES, overrides the
+    store's default.
+    """
+    options = {} if fsync is None else {'fsync': fsync}
+    if not url:
+        return FileStateStore(state_file, **options)
+    if url == 'memory://':
+        return MemoryStateStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteStateStore(url[len('sqlite:///'):], **options)
+    raise ValueError(f"Unsupported state store URL: {url}")
+
+# How journal events reach the store:
+#   none           nothing is loaded or written (MemoryStateStore)
+#   write-through  every mutation is appended and fsynced before returning
+#   debounced      buffered until writes pause for flush_delay (flush_interval at most)
+#   interval       buffered and flushed every flush_interval seconds
+#   checkpoint     only checkpoint() writes, as a snapshot of the nodes changed
+#                  since the previous one where the store supports that
+PERSISTENCE_POLICIES = ('none', 'write-through', 'debounced', 'interval', 'checkpoint')
+
+TXN_TYPES = ("completion", "attestation", "ap_reveal")
+TXN_FIELDS = ('qid', 'pubkey', 'ans', 'type')
+
+def txn_record_error(record) -> Optional[str]:
+    """Why a {qid, pubkey, ans, type} record cannot become a transaction, or None."""
+    if not isinstance(record, dict):
+        return "Record must be an object"
+    missing = [k for k in TXN_FIELDS if k not in record]
+    if missing:
+        return f"Missing {', '.join(missing)}"
+    wrong = [k for k in TXN_FIELDS if not isinstance(record[k], str)]
+    if wrong:
+        return f"{', '.join(wrong)} must be {'a string' if len(wrong) == 1 else 'strings'}"
+    if record['type'] not in TXN_TYPES:
+        return f"Unknown txn type {record['type']!r}"
+    return None
+
+# --- CHANGE FEED ---
+class ChangeFeed:
+    """Recent state changes, encoded once as SSE frames for every listener.
+
+    Each change carries the seq of the journal event it came from, which is
+    also the client's resume token (the SSE Last-Event-ID). The newest
+    ``capacity`` changes are retained; a client resuming from before them,
+    or from before a full reload, is told to ``reset`` and refetch /state.
+    Listeners block on a condition variable, so an idle stream costs
+    nothing but a parked greenlet (a parked thread on thread workers).
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self._changes = deque(maxlen=capacity)  # (seq, pubkeys involved, frame)
+        self._floor = 0  # Changes at or below this seq are no longer available
+        self._last_seq = 0
+        self._reputations: Dict[str, float] = {}
+        self._cond = threading.Condition()
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def reset(self, seq: int, nodes: Dict[str, 'Node']):
+        """Drops retained changes; state up to seq must be refetched in full."""
+        with self._cond:
+            self._changes.clear()
+            self._floor = self._last_seq = seq
+            self._reputations = {pubkey: node.reputation for pubkey, node in nodes.items()}
+            self._cond.notify_all()
+
+    def publish(self, event: Dict, nodes: Dict[str, 'Node']):
+        """Records a journal event that has just been applied to nodes."""
+        op, seq = event['op'], event['seq']
+        change: Dict = {'op': op}
+        if op == 'add_node':
+            change.update(pubkey=event['pubkey'], archetype=event['archetype'], reputation=event['reputation'])
+            pubkeys = {event['pubkey']}
+            self._reputations[event['pubkey']] = event['reputation']
+        elif op == 'txns':
+            change.update(pubkey=event['pubkey'], txns=[
+                {'id': t['id'], 'question_id': t['question_id'], 'type': t['type'], 'owner_pubkey': t['owner_pubkey']}
+                for t in event['txns']
+            ])
+            pubkeys = {event['pubkey']}
+        elif op == 'block':
+            block = event['block']
+            change.update(
+                pubkey=event['pubkey'], hash=block['hash'], prev_hash=block['prev_hash'],
+                type=block['type'], txns=len(block['txns']), height=len(nodes[event['pubkey']].chain),
+            )
+            pubkeys = {event['pubkey']}
+        elif op == 'adopt_chain':
+            chain = nodes[event['pubkey']].chain
+            change.update(pubkey=event['pubkey'], source=event['source'], tip=chain.tip_hash, height=len(chain))
+            pubkeys = {event['pubkey'], event['source']}
+        elif op == 'reputation':
+            change['reputations'] = {
+                pubkey: {'reputation': value, 'delta': value - self._reputations.get(pubkey, value)}
+                for pubkey, value in event['reputations'].items()
+            }
+            self._reputations.update(event['reputations'])
+            pubkeys = set(event['reputations'])
+        else:
+            return
+        frame = f"id: {seq}\ndata: {json.dumps(change)}\n\n".encode()
+        with self._cond:
+            if len(self._changes) == self._changes.maxlen:
+                self._floor = self._changes[0][0]
+            self._changes.append((seq, pubkeys, frame))
+            self._last_seq = seq
+            self._cond.notify_all()
+
+    def changes_after(self, seq: int, pubkey: Optional[str] = None) -> Tuple[Optional[List[bytes]], int]:
+        """(frames after seq, optionally only those involving pubkey, new token).
+
+        The frames are None when seq cannot be resumed from.
+        """
+        with self._cond:
+            if seq < self._floor or seq > self._last_seq:
+                return None, self._last_seq
+            frames = [
+                frame for change_seq, pubkeys, frame in self._changes
+                if change_seq > seq and (pubkey is None or pubkey in pubkeys)
+            ]
+            return frames, self._last_seq
+
+    def wait(self, seq: int, timeout: float) -> bool:
+        """Blocks until a change newer than seq arrives; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._last_seq != seq, timeout)
+
+    @staticmethod
+    def reset_frame(seq: int) -> bytes:
+        return f"id: {seq}\ndata: {json.dumps({'op': 'reset'})}\n\n".encode()
+
+# --- METRICS ---
+# Latency histogram bounds in seconds; most engine calls finish well under 5ms
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _prometheus_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metrics:
+    """Counters and latency histograms, rendered in Prometheus text format.
+
+    A series is keyed by (metric name, tuple of label pairs). Recording costs
+    a bisect and a short critical section, so instrumentation stays on under
+    load; gauges are not stored but computed by the caller at scrape time.
+    """
+    HELP = {
+        'pok_engine_seconds': ('histogram', 'Time spent in POKEngine methods.'),
+        'pok_http_request_seconds': ('histogram', 'Time spent serving HTTP requests.'),
+        'pok_http_requests_total': ('counter', 'HTTP requests served, by status.'),
+        'pok_journal_events_total': ('counter', 'Journal events recorded.'),
+        'pok_blocks_mined_total': ('counter', 'Blocks appended by proposals.'),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        # Per-bucket counts (the last one is +Inf) followed by the sum
+        self._histograms: Dict[Tuple[str, tuple], List[float]] = {}
+
+    def inc(self, key: Tuple[str, tuple], amount: float = 1.0):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def observe(self, key: Tuple[str, tuple], seconds: float):
+        i = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            hist[i] += 1
+            hist[-1] += seconds
+
+    def render(self, gauges=()) -> str:
+        """Prometheus exposition text; gauges are (name, help, [(labels, value)])."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(hist) for key, hist in self._histograms.items()}
+        lines = []
+        for name, (kind, text) in self.HELP.items():
+            series = [(key[1], value) for key, value in (counters if kind == 'counter' else histograms).items()
+                      if key[0] == name]
+            if not series:
+                continue
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+            for labels, value in sorted(series):
+                if kind == 'counter':
+                    lines.append(f'{name}{_prometheus_labels(labels)} {value:g}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_prometheus_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{_prometheus_labels(labels)} {value[-1]:.6f}')
+                lines.append(f'{name}_count{_prometheus_labels(labels)} {cumulative}')
+        for name, text, samples in gauges:
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} gauge']
+            lines += [f'{name}{_prometheus_labels(labels)} {value:g}' for labels, value in samples]
+        return '\n'.join(lines) + '\n'
+
+
+def timed(method):
+    """Records each call's wall time in the engine's pok_engine_seconds histogram."""
+    key = ('pok_engine_seconds', (('method', method.__name__.lstrip('_')),))
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.metrics.observe(key, time.perf_counter() - start)
+    return wrapper
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler for a live server, off until started.
+
+    While running, a background OS thread reads every other thread's
+    Python stack through sys._current_frames() each ``interval`` seconds,
+    so the sampled threads are never interrupted. Under gevent that only
+    shows the greenlet running at the time, so the stacks of the suspended
+    greenlets (gr_frame) are sampled too. Samples are aggregated in the
+    collapsed-stack format ("a.py:f;b.py:g 12") that flamegraph.pl and
+    speedscope read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None  # Handle from start_os_thread
+        self._stopping = False
+        self._greenlets: Optional[weakref.WeakSet] = None
+        self._previous_trace = None
+        self.interval = 0.005
+        self.samples: Dict[str, int] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = 0.005) -> bool:
+        """Starts sampling afresh; False if already running."""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self.interval = interval
+            self.samples = {}
+            self._stopping = False
+            if _gevent_patched():
+                self._track_greenlets()
+            self._thread = start_os_thread(self._sample, 'pok-profiler')
+            return True
+
+    def stop(self) -> str:
+        """Stops sampling and returns the collapsed stacks."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopping = True
+            thread.join()
+            if self._greenlets is not None:
+                from greenlet import settrace
+                settrace(self._previous_trace)
+                self._greenlets = self._previous_trace = None
+        return self.collapsed()
+
+    def _track_greenlets(self):
+        # The live greenlets, then every one switched to while sampling.
+        # Called on the worker's own thread, whose switches the trace sees.
+        from greenlet import greenlet, settrace
+        greenlets = weakref.WeakSet(obj for obj in gc.get_objects() if isinstance(obj, greenlet))
+        previous = None
+
+        def trace(event, args):
+            if event in ('switch', 'throw'):
+                greenlets.add(args[1])
+            if previous is not None:
+                previous(event, args)
+
+        previous = settrace(trace)
+        self._greenlets, self._previous_trace = greenlets, previous
+
+    def _sample(self):
+        own = _unpatched('_thread', 'get_ident')()
+        sleep = _unpatched('time', 'sleep')
+        while not self._stopping:
+            sleep(self.interval)
+            frames = [frame for ident, frame in sys._current_frames().items() if ident != own]
+            greenlets = self._greenlets
+            if greenlets is not None:
+                # Copying the underlying set is a single step under the GIL,
+                # so the trace may keep adding to it meanwhile
+                for ref in list(greenlets.data):
+                    glet = ref()
+                    # gr_frame is None for the running greenlet, seen above
+                    if glet is not None and glet.gr_frame is not None:
+                        frames.append(glet.gr_frame)
+            for frame in frames:
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def collapsed(self) -> str:
+        ranked = sorted(self.samples.items(), key=lambda item: -item[1])
+        return ''.join(f"{stack} {count}\n" for stack, count in ranked)
+
 # --- CORE ENGINE CLASS ---
 class POKEngine:
-    def __init__(self, curriculum_file: str):
-        self.curriculum = self._load_curriculum(curriculum_file)
+    def __init__(
+        self,
+        curriculum_file: str,
+        state_file: str = 'data/app_state.json',
+        store: Optional[StateStore] = None,
+        quorum_conv_thresh: float = 0.7,
+        thought_leader_thresh: float = 0.5,
+        thought_leader_bonus: float = 2.5,
+        persistence: str = 'write-through',
+        flush_delay: float = 0.5,
+        flush_interval: float = 5.0,
+    ):
+        if persistence not in PERSISTENCE_POLICIES:
+            raise ValueError(f"Unknown persistence policy: {persistence}")
+        if persistence == 'none':
+            store = MemoryStateStore()
+        self.curriculum = Curriculum.load(curriculum_file)
         self.nodes: Dict[str, Node] = {}
-        self.quorum_conv_thresh = 0.7
-        self.thought_leader_thresh = 0.5
-        self.thought_leader_bonus = 2.5
-        self.state_file = 'data/app_state.json'
+        self.metrics = Metrics()
+        self.quorum_conv_thresh = quorum_conv_thresh
+        self.thought_leader_thresh = thought_leader_thresh
+        self.thought_leader_bonus = thought_leader_bonus
+        # Snapshot plus append-only journal: every mutation appends a small event
+        # record, and the full snapshot is only rewritten every `snapshot_interval`
+        # events, so persisting a write costs O(change) rather than O(state).
+        self.state_file = state_file
+        self.store = store if store is not None else FileStateStore(state_file)
+        if self.store.shared and persistence != 'write-through':
+            # Other processes build on our journal, so it cannot lag behind
+            raise ValueError("Shared state stores need the write-through persistence policy")
+        self.persistence = persistence
+        self.flush_delay = flush_delay
+        self.flush_interval = flush_interval
+        self.snapshot_interval = 500
+        self.journal_seq = 0
+        self._journal_entries = 0
+        # Lock order: _refresh_lock (shared stores only), _nodes_lock, node
+        # locks by pubkey, _reputation_lock, _journal_lock. Journal events are
+        # appended while the locks covering the mutation are held, so journal
+        # order matches mutation order.
+        self._refresh_lock = threading.RLock()
+        self._nodes_lock = threading.RLock()
+        self._reputation_lock = threading.RLock()
+        self._journal_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        # Memoized convergence: a cached result is valid while its question's
+        # epoch is unchanged. Changing an attester's reputation, or adding the
+        # node of an attester that was skipped as unknown, bumps the epoch of
+        # every question with a cached result that depends on that attester.
+        # _convergence_lock is taken last and never held while taking another.
+        self._convergence_lock = threading.Lock()
+        self._convergence_epochs: Dict[str, int] = {}
+        self._convergence_watchers: Dict[str, set] = {}  # attester pubkey -> qids
+        self._reputation_version = 0  # Bumped by every invalidation
+        # Events held back by the debounced and interval policies, guarded by
+        # _journal_lock; the flusher thread waits on _flush_cond.
+        self._pending_events: List[Dict] = []
+        self._pending_since = self._last_append = 0.0
+        self._flush_cond = threading.Condition(self._journal_lock)
+        self._closed = False
+        # Pubkeys journaled since the last snapshot, guarded by _journal_lock;
+        # None while the next snapshot must be full. Only journaled changes
+        # are tracked, so state mutated outside the journal (a simulation's
+        # node.progress) reaches disk with the next full snapshot.
+        self._dirty: Optional[set] = None
+        # Transaction ids come from a counter, not the clock, so bursts
+        # within one time.time() tick never collide; see _txn_id.
+        self._id_seq = itertools.count(int.from_bytes(os.urandom(8), 'big'))
+        self.changes = ChangeFeed()
+        # Called with the pubkey of every node whose mempool grew or whose
+        # chain was replaced, under the journal lock; see MiningScheduler.
+        self.activity_listeners: List = []
         self.load_state_from_disk()
+        if persistence in ('debounced', 'interval'):
+            threading.Thread(target=self._flush_loop, name='pok-flush', daemon=True).start()
 
-    def _load_curriculum(self, file_path: str) -> List[Question]:
-        try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-                return [
-                    Question(
-                        id=q.get('id'),
-                        prompt=q.get('prompt'),
-                        qtype=q.get('type', 'mcq'),
-                        choices=q.get('attachments', {}).get('choices', []),
-                        answer_key=q.get('attachments', {}).get('answerKey'),
-                    )
-                    for q in data
-                ]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-
+    @timed
     def add_node(
         self,
         pubkey: str,
         archetype: str,
         provisional_reputation: Optional[float] = None,
     ) -> Node:
-        if pubkey in self.nodes:
-            return self.nodes[pubkey]
+        with self._write_transaction(), self._nodes_lock:
+            if pubkey in self.nodes:
+                return self.nodes[pubkey]
 
-        if provisional_reputation is None:
-            if self.nodes:
-                reps = [node.reputation for node in self.nodes.values()]
-                provisional_reputation = statistics.median(reps) if reps else 1.0
-            else:
-                provisional_reputation = 1.0
+            if provisional_reputation is None:
+                if self.nodes:
+                    reps = [node.reputation for node in self.nodes.values()]
+                    provisional_reputation = statistics.median(reps) if reps else 1.0
+                else:
+                    provisional_reputation = 1.0
 
-        node = Node(
-            pubkey=pubkey, archetype=archetype, reputation=provisional_reputation
-        )
-        self.nodes[pubkey] = node
-        self.save_state_to_disk()
+            node = self._adopt_node(Node(
+                pubkey=pubkey, archetype=archetype, reputation=provisional_reputation
+            ))
+            self._invalidate_convergence([pubkey])
+            self._append_journal({
+                'op': 'add_node',
+                'pubkey': pubkey,
+                'archetype': archetype,
+                'reputation': provisional_reputation,
+            })
+        self._maybe_compact()
         return node
 
+    @contextmanager
+    def node_locks(self, *nodes: Node):
+        """Holds the given nodes' locks, always acquired in pubkey order."""
+        ordered = sorted({n.pubkey: n for n in nodes}.values(), key=lambda n: n.pubkey)
+        for node in ordered:
+            node.lock.acquire()
+        try:
+            yield
+        finally:
+            for node in reversed(ordered):
+                node.lock.release()
+
+    def _txn_id(self) -> int:
+        # Unique per engine by construction (the mix is a bijection on 64-bit
+        # values); random starting points keep workers' ranges apart.
+        z = next(self._id_seq) & _ID_MASK
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _ID_MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _ID_MASK
+        return z ^ (z >> 31)
+
     def create_txn(
         self, qid: str, pubkey: str, ans: str, t: float, txn_type: str
     ) -> Transaction:
-        txn_hash = hashlib.sha256(str(ans).encode()).hexdigest()
         return Transaction(
-            id=f"{t}-{pubkey[:5]}-{txn_type}",
+            id=self._txn_id(),
             timestamp=t,
             owner_pubkey=pubkey,
             question_id=qid,
             type=txn_type,
-            payload=Payload(answer=str(ans), hash=txn_hash),
+            payload=answer_payload(str(ans)),
         )
 
+    def create_txns(self, specs) -> List[Transaction]:
+        """Builds transactions from (qid, pubkey, ans, t, txn_type) tuples in one pass."""
+        payload_for, txn_id = answer_payload, self._txn_id
+        return [
+            Transaction(txn_id(), t, pubkey, qid, txn_type, payload_for(str(ans)))
+            for qid, pubkey, ans, t, txn_type in specs
+        ]
+
+    @timed
+    def add_txns(self, node: Node, txns: List[Transaction]) -> List[Transaction]:
+        """Appends transactions to a node's mempool and journals the addition."""
+        with self._write_transaction(), node.lock:
+            added = node.mempool.extend(txns)
+            if added:
+                try:
+                    self._append_journal(
+                        {'op': 'txns', 'pubkey': node.pubkey, 'txns': [txn_to_dict(t) for t in added]}
+                    )
+                except BaseException:
+                    # Not journaled, so a restart would not have them either
+                    node.mempool.discard_ids([t.id for t in added])
+                    raise
+        self._maybe_compact()
+        return added
+
+    @timed
+    def submit_txns(self, records: List[Dict]) -> List[Dict]:
+        """Creates and queues a batch of {qid, pubkey, ans, type} records.
+
+        Records are validated and hashed in one pass, grouped into their
+        owners' mempools, and persisted with a single journal append (one
+        fsync). Returns one result per record, in order.
+        """
+        results: List[Dict] = []
+        pending: List[tuple] = []
+        specs: List[tuple] = []
+        for record in records:
+            error = txn_record_error(record)
+            if error:
+                results.append({"error": error})
+                continue
+            node = self.nodes.get(record['pubkey'])
+            if node is None:
+                results.append({"error": "Node not found"})
+                continue
+            specs.append((record['qid'], record['pubkey'], record['ans'], time.time(), record['type']))
+            results.append(None)
+            pending.append((len(results) - 1, node))
+
+        txns = self.create_txns(specs)
+        pending = [(i, node, txn) for (i, node), txn in zip(pending, txns)]
+        for i, _, txn in pending:
+            results[i] = {"status": "success", "txn_id": txn_id_to_str(txn.id)}
+
+        events = []
+        inserted = []
+        nodes = list({id(node): node for _, node, _ in pending}.values())
+        with self._write_transaction(), self.node_locks(*nodes):
+            for node in nodes:
+                added = node.mempool.extend(txn for _, n, txn in pending if n is node)
+                if added:
+                    inserted.append((node, [t.id for t in added]))
+                    events.append(
+                        {'op': 'txns', 'pubkey': node.pubkey, 'txns': [txn_to_dict(t) for t in added]}
+                    )
+                added_ids = {t.id for t in added}
+                for i, n, txn in pending:
+                    if n is node and txn.id not in added_ids:
+                        results[i] = {"error": "Duplicate transaction id", "txn_id": txn_id_to_str(txn.id)}
+            try:
+                self._append_journal(*events)
+            except BaseException:
+                # Not journaled, so a restart would not have them either
+                for node, txn_ids in inserted:
+                    node.mempool.discard_ids(txn_ids)
+                raise
+        self._maybe_compact()
+        return results
+
     def calculate_convergence(
         self, node: Node, qid: str, weighted: bool = False
     ) -> float:
-        all_txns = node.mempool + [txn for block in node.chain for txn in block.txns]
-        attns = [
-            txn
-            for txn in all_txns
-            if txn.question_id == qid and txn.type in ("attestation", "ap_reveal")
-        ]
-        dist: Dict[str, float] = {}
+        """Share of the leading answer among node's attestations for qid.
 
-        for txn in attns:
-            attester_pubkey = txn.owner_pubkey
-            if attester_pubkey not in self.nodes:
-                continue
+        Results are memoized per node and question until an attestation for
+        the question reaches or leaves the node, or an attester it depends
+        on changes reputation or joins.
+        """
+        with node.lock:
+            index = node.question_index
+            cached = index.convergence.get(qid, {}).get(weighted)
+            with self._convergence_lock:
+                epoch = self._convergence_epochs.get(qid, 0)
+                version = self._reputation_version
+            if cached is not None and cached[0] == epoch:
+                return cached[1]
+
+            if weighted:
+                dist: Dict[bytes, float] = {}
+                attesters = set()
+                for txn in index.txns.get(qid, ()):
+                    attester_pubkey = txn.owner_pubkey
+                    attesters.add(attester_pubkey)
+                    if attester_pubkey not in self.nodes:
+                        continue
+
+                    weight = 10.0
+                    if txn.type != "ap_reveal":
+                        weight = math.log1p(self.nodes[attester_pubkey].reputation)
 
-            weight = 1.0
-            if txn.type == "ap_reveal":
-                weight = 10.0
-            elif weighted:
-                weight = math.log1p(self.nodes[attester_pubkey].reputation)
+                    dist[txn.payload.digest] = dist.get(txn.payload.digest, 0) + weight
+            else:
+                dist = index.tally(qid, self.nodes)
+                # Unweighted tallies only change when a skipped attester joins
+                attesters = index.unknown_attesters(qid)
+
+            total_weight = sum(dist.values())
+            value = max(dist.values()) / total_weight if total_weight > 0 else 0.0
+            with self._convergence_lock:
+                for pubkey in attesters:
+                    self._convergence_watchers.setdefault(pubkey, set()).add(qid)
+                # A change that raced with this computation may not be reflected
+                if self._reputation_version == version:
+                    index.convergence.setdefault(qid, {})[weighted] = (epoch, value)
+        return value
 
-            dist[txn.payload.hash] = dist.get(txn.payload.hash, 0) + weight
+    def _adopt_node(self, node: Node) -> Node:
+        """Adds node to self.nodes and listens for its reputation changes."""
+        object.__setattr__(node, '_reputation_listener', self._reputation_changed)
+        self.nodes[node.pubkey] = node
+        return node
 
-        total_weight = sum(dist.values())
-        return max(dist.values()) / total_weight if total_weight > 0 else 0.0
+    def _reputation_changed(self, pubkey: str):
+        self._invalidate_convergence([pubkey])
 
+    def _invalidate_convergence(self, pubkeys):
+        """Drops memoized convergence that depends on any of these attesters."""
+        with self._convergence_lock:
+            self._reputation_version += 1
+            for pubkey in pubkeys:
+                for qid in self._convergence_watchers.pop(pubkey, ()):
+                    self._convergence_epochs[qid] = self._convergence_epochs.get(qid, 0) + 1
+
+    @timed
     def propose_attestation_block(self, node: Node):
-        attns = [txn for txn in node.mempool if txn.type == "attestation"]
-        if len(attns) >= 5:
-            block_hash = f"{len(node.chain)}-att-block"
-            new_block = Block(block_hash, attns, "attestation")
-            node.chain.append(new_block)
-            mined_ids = {t.id for t in attns}
-            node.mempool = [txn for txn in node.mempool if txn.id not in mined_ids]
-        self.save_state_to_disk()
+        with self._write_transaction(), node.lock:
+            attns = [txn for txn in node.mempool if txn.type == "attestation"]
+            if len(attns) >= 5:
+                new_block = Block.create(attns, "attestation", node.chain.tip_hash)
+                node.chain = node.chain.with_block(new_block)
+                self.metrics.inc(('pok_blocks_mined_total', (('type', 'attestation'),)))
+                node.mempool.discard_ids([t.id for t in attns])
+                self._append_journal(
+                    {'op': 'block', 'pubkey': node.pubkey, 'block': block_to_dict(new_block)}
+                )
+        self._maybe_compact()
 
+    @timed
     def propose_pok_block(self, node: Node):
+        with self._write_transaction(), node.lock:
+            self._propose_pok_block(node)
+        self._maybe_compact()
+
+    def _propose_pok_block(self, node: Node):
         minable_completions = []
         for txn in node.mempool:
             if txn.type == "completion" and txn.owner_pubkey == node.pubkey:
                 min_attest = 2 if node.progress < len(self.curriculum) / 2 else 4
-                all_visible_txns = node.mempool + [
-                    tx for b in node.chain for tx in b.txns
-                ]
-                attns_for_txn = [
-                    t
-                    for t in all_visible_txns
-                    if t.question_id == txn.question_id and t.type == "attestation"
-                ]
+                attn_count = node.question_index.attestation_counts.get(
+                    txn.question_id, 0
+                )
 
                 if (
-                    len(attns_for_txn) >= min_attest
+                    attn_count >= min_attest
                     and self.calculate_convergence(node, txn.question_id)
                     >= self.quorum_conv_thresh
                 ):
@@ -178,49 +2107,48 @@ class POKEngine:
         minable_qids = {t.question_id for t in minable_completions}
         related_attestations = [
             t
-            for t in node.mempool
-            if t.question_id in minable_qids and t.type == "attestation"
+            for qid in minable_qids
+            for t in node.mempool.bucket(qid).values()
+            if t.type == "attestation"
         ]
 
         txns_for_block = minable_completions + related_attestations
 
-        block_hash = f"{len(node.chain)}-pok-block"
-        new_block = Block(block_hash, txns_for_block, "pok")
-        node.chain.append(new_block)
-
-        mined_txn_ids = {t.id for t in txns_for_block}
-        node.mempool = [t for t in node.mempool if t.id not in mined_txn_ids]
-        self._update_reputation(node, minable_completions)
-        self.save_state_to_disk()
+        new_block = Block.create(txns_for_block, "pok", node.chain.tip_hash)
+        node.chain = node.chain.with_block(new_block)
+        self.metrics.inc(('pok_blocks_mined_total', (('type', 'pok'),)))
 
-    def _update_reputation(self, node: Node, mined_txns: List[Transaction]):
-        """Updates reputation with Thought Leader bonus and logarithmic scaling."""
-        for txn in mined_txns:
-            qid = txn.question_id
-            final_ans_hash = txn.payload.hash
-            all_visible_txns = node.mempool + [tx for b in node.chain for tx in b.txns]
-            attns = [
-                t
-                for t in all_visible_txns
-                if t.question_id == qid and t.type == "attestation"
-            ]
+        node.mempool.discard_ids([t.id for t in txns_for_block])
+        events = [{'op': 'block', 'pubkey': node.pubkey, 'block': block_to_dict(new_block)}]
+        # Attesters are other nodes, so reputation has its own lock, held until
+        # the new values are journaled in order.
+        with self._reputation_lock:
+            reputations = self._update_reputation(node, minable_completions)
+            if reputations:
+                events.append({'op': 'reputation', 'reputations': reputations})
+            self._append_journal(*events)
 
-            # Sort attestations by timestamp
-            attns.sort(key=lambda x: x.timestamp)
+    @timed
+    def _update_reputation(
+        self, node: Node, mined_txns: List[Transaction]
+    ) -> Dict[str, float]:
+        """Updates reputation with Thought Leader bonus and logarithmic scaling.
 
-            # Initialize running distribution
-            dist = {}
-            total_count = 0
+        Attesters who backed the mined answer while it still held less than
+        thought_leader_thresh of earlier attestations earn the bonus. Returns
+        the new reputation of every attester that changed.
+        """
+        changed: Dict[str, float] = {}
+        for txn in mined_txns:
+            hist = node.question_index.history.get(txn.question_id)
+            if hist is None:
+                continue
+            final_digest = txn.payload.digest
 
-            for attn in attns:
+            for attn in hist.txns:
                 attester = self.nodes.get(attn.owner_pubkey)
-                if attester and attn.payload.hash == final_ans_hash:
-                    # Calculate proportion at time of attestation
-                    prop_at_time = (
-                        max(dist.values()) / total_count
-                        if total_count > 0 and dist
-                        else 0.0
-                    )
+                if attester and attn.payload.digest == final_digest:
+                    prop_at_time = self._lookup_prop(hist, attn.timestamp, final_digest)
                     bonus = (
                         self.thought_leader_bonus
                         if prop_at_time < self.thought_leader_thresh
@@ -228,87 +2156,486 @@ class POKEngine:
                     )
                     weight = math.log1p(attester.reputation)
                     attester.reputation += bonus * weight
+                    changed[attester.pubkey] = attester.reputation
+        return changed
 
-                    # Update running distribution
-                    dist[attn.payload.hash] = dist.get(attn.payload.hash, 0) + 1
-                    total_count += 1
-
+    @timed
     def sync_nodes(self, node1: Node, node2: Node):
-        """Syncs two nodes with longest chain rule and 25% gossip for attestations."""
-        if len(node1.chain) < len(node2.chain):
-            node1.chain = list(node2.chain)
-        elif len(node2.chain) < len(node1.chain):
-            node2.chain = list(node1.chain)
-
-        # Use sets for efficient handling of unique transactions
-        node1_mempool_ids = {t.id for t in node1.mempool}
-        node2_mempool_ids = {t.id for t in node2.mempool}
-        
-        all_txns_map = {t.id: t for t in node1.mempool + node2.mempool}
-
-        node1.mempool.extend([t for t_id, t in all_txns_map.items() if t_id not in node1_mempool_ids])
-        node2.mempool.extend([t for t_id, t in all_txns_map.items() if t_id not in node2_mempool_ids])
-
-        # Gossip Protocol
-        all_attestations = [txn for txn in all_txns_map.values() if txn.type == "attestation"]
-        if all_attestations:
-            gossip_sample_size = int(len(all_attestations) * 0.25)
-            gossip_txns = random.sample(all_attestations, gossip_sample_size)
-            gossip_ids = {t.id for t in gossip_txns}
-            
-            node1.mempool.extend([t for t in gossip_txns if t.id not in node1_mempool_ids])
-            node2.mempool.extend([t for t in gossip_txns if t.id not in node2_mempool_ids])
-        self.save_state_to_disk()
+        """Syncs two nodes with the longest chain rule and mempool reconciliation.
+
+        Mempools are reconciled bucket by bucket: peers compare per-question
+        digests and only exchange transactions from buckets that differ, so
+        peers that already agree cost O(1).
+        """
+        with self._write_transaction(), self.node_locks(node1, node2):
+            events = []
+            if len(node1.chain) < len(node2.chain):
+                node1.chain = node2.chain
+                events.append({'op': 'adopt_chain', 'pubkey': node1.pubkey, 'source': node2.pubkey})
+            elif len(node2.chain) < len(node1.chain):
+                node2.chain = node1.chain
+                events.append({'op': 'adopt_chain', 'pubkey': node2.pubkey, 'source': node1.pubkey})
 
-    def _lookup_prop(self, hist: List, timestamp: float) -> float:
+            node1_missing = node1.mempool.missing_from(node2.mempool)
+            node2_missing = node2.mempool.missing_from(node1.mempool)
+            for node, missing in ((node1, node1_missing), (node2, node2_missing)):
+                added = node.mempool.extend(missing)
+                if added:
+                    events.append({'op': 'txns', 'pubkey': node.pubkey, 'txns': [txn_to_dict(t) for t in added]})
+            self._append_journal(*events)
+        self._maybe_compact()
+
+    def _lookup_prop(
+        self, hist: ConvergenceHistory, timestamp: float, ans_digest: bytes
+    ) -> float:
         """Helper method to lookup proportion at a given timestamp."""
-        # Implementation needed - placeholder for now
-        return 0.0
+        return hist.proportion_at(timestamp, ans_digest)
+
+    @contextmanager
+    def _write_transaction(self):
+        """Serializes writers across processes when the store is shared.
+
+        Holds the store's write lock and replays events other processes
+        committed first, so the mutation and the seqs it journals build on
+        the latest state. A no-op for single-process stores.
+        """
+        if not self.store.shared:
+            yield
+            return
+        with self._refresh_lock, self.store.write_lock():
+            self._catch_up()
+            yield
+
+    def refresh(self):
+        """Applies journal events other processes have written since our last look."""
+        if self.store.shared:
+            with self._refresh_lock:
+                self._catch_up()
+
+    def _catch_up(self):
+        events = self.store.read_events(self.journal_seq)
+        if events is None:
+            # We fell behind a compaction; start over from the snapshot.
+            with self._nodes_lock:
+                self.nodes.clear()
+                self.journal_seq = 0
+                self._journal_entries = 0
+                self.load_state_from_disk()
+            return
+        for event in events:
+            touched = [
+                self.nodes[pubkey]
+                for pubkey in {event.get('pubkey'), event.get('source'), *event.get('reputations', ())}
+                if pubkey in self.nodes
+            ]
+            with self._nodes_lock, self.node_locks(*touched), self._reputation_lock:
+                self._replay_event(event)
+                self.journal_seq = event['seq']
+                self.changes.publish(event, self.nodes)
+
+    @timed
+    def _append_journal(self, *events: Dict):
+        """Records events in the write-ahead journal as the persistence policy says.
+
+        Write-through appends them with a single fsync; debounced and interval
+        buffer them for the flusher; none and checkpoint drop them, since
+        only snapshots are written. Callers hold the locks of everything the
+        events describe. Compaction needs every node lock, so it is left to
+        _maybe_compact, which public methods call once their own locks are
+        released.
+        """
+        if not events:
+            return
+        with self._journal_lock:
+            records = [dict(event, seq=self.journal_seq + i) for i, event in enumerate(events, 1)]
+            if self.persistence == 'write-through':
+                self.store.append_events(records)  # Nothing is recorded if this raises
+            elif self.persistence in ('debounced', 'interval'):
+                self._last_append = time.monotonic()
+                if not self._pending_events:
+                    self._pending_since = self._last_append
+                self._pending_events.extend(records)
+                self._flush_cond.notify()
+            self.journal_seq = records[-1]['seq']
+            self._journal_entries += len(events)
+            self.metrics.inc(('pok_journal_events_total', ()), len(events))
+            if self._dirty is not None:
+                for event in events:
+                    self._mark_dirty(event)
+            # Published in journal order, once the policy has handled them
+            for record in records:
+                self.changes.publish(record, self.nodes)
+                if self.activity_listeners and record['op'] in ('txns', 'adopt_chain'):
+                    for listener in self.activity_listeners:
+                        listener(record['pubkey'])
+
+    def _write_pending(self):
+        # Caller holds _journal_lock
+        if self._pending_events:
+            self.store.append_events(self._pending_events)
+            self._pending_events = []
+
+    def _flush_loop(self):
+        with self._flush_cond:
+            while not self._closed:
+                if not self._pending_events:
+                    self._flush_cond.wait()
+                    continue
+                due = self._pending_since + self.flush_interval
+                if self.persistence == 'debounced':
+                    due = min(due, self._last_append + self.flush_delay)
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    self._flush_cond.wait(remaining)
+                else:
+                    self._write_pending()
+
+    def flush(self):
+        """Writes journal events the debounced or interval policy is holding back."""
+        with self._journal_lock:
+            self._write_pending()
+
+    def checkpoint(self):
+        """Makes the current state durable under any policy but none."""
+        self.save_state_to_disk()
+
+    def close(self):
+        """Stops the flusher thread and writes the events it still holds."""
+        with self._flush_cond:
+            self._closed = True
+            self._write_pending()
+            self._flush_cond.notify_all()
+
+    def metrics_text(self) -> str:
+        """Recorded metrics plus current size gauges, in Prometheus text format."""
+        with self._nodes_lock:
+            nodes = list(self.nodes.values())
+        with self._journal_lock:
+            pending = len(self._pending_events)
+        by_node = lambda size: [((('pubkey', node.pubkey),), size(node)) for node in nodes]
+        return self.metrics.render([
+            ('pok_nodes', 'Registered nodes.', [((), len(nodes))]),
+            ('pok_mempool_txns', 'Pending transactions per node.', by_node(lambda node: len(node.mempool))),
+            ('pok_chain_blocks', 'Chain length per node.', by_node(lambda node: len(node.chain))),
+            ('pok_journal_seq', 'Seq of the latest journal event.', [((), self.journal_seq)]),
+            ('pok_journal_pending_events', 'Journal events buffered by the persistence policy.', [((), pending)]),
+            ('pok_state_bytes', 'Bytes of persisted state.', [((), self.store.size_bytes())]),
+        ])
+
+    def _maybe_compact(self):
+        if self.persistence in ('none', 'checkpoint'):
+            return  # No journal to compact; snapshots come from checkpoint()
+        if self._journal_entries >= self.snapshot_interval:
+            self.save_state_to_disk()
+
+    def _mark_dirty(self, event: Dict):
+        # Nodes whose snapshot state the event changes; adopt_chain's source is unchanged
+        if 'pubkey' in event:
+            self._dirty.add(event['pubkey'])
+        self._dirty.update(event.get('reputations', ()))
 
+    def _replay_event(self, event: Dict):
+        """Re-applies a single journal event to the in-memory state."""
+        if self._dirty is not None:
+            self._mark_dirty(event)
+        op = event['op']
+        if op == 'add_node':
+            if event['pubkey'] not in self.nodes:
+                self._adopt_node(Node(
+                    pubkey=event['pubkey'],
+                    archetype=event['archetype'],
+                    reputation=event['reputation'],
+                ))
+                self._invalidate_convergence([event['pubkey']])
+        elif op == 'txns':
+            node = self.nodes[event['pubkey']]
+            node.mempool.extend(txn_from_dict(txn) for txn in event['txns'])
+        elif op == 'block':
+            node = self.nodes[event['pubkey']]
+            block = block_from_dict(event['block'])
+            node.chain = node.chain.with_block(block)
+            node.mempool.discard_ids([t.id for t in block.txns])
+        elif op == 'reputation':
+            for pubkey, reputation in event['reputations'].items():
+                self.nodes[pubkey].reputation = reputation
+        elif op == 'adopt_chain':
+            self.nodes[event['pubkey']].chain = self.nodes[event['source']].chain
+
+    def _capture_state(self):
+        """Takes every lock briefly to copy a consistent view of the engine.
+
+        Chains are immutable and transactions are never mutated, so the view
+        only copies tip references and mempool entries, not history. The
+        store rotates its journal at the same instant. When the store takes
+        partial snapshots only the nodes journaled since the last one are
+        copied. Returns (seq, views, partial, the dirty set taken).
+        """
+        with self._nodes_lock:
+            nodes = list(self.nodes.values())
+            with self.node_locks(*nodes), self._reputation_lock, self._journal_lock:
+                dirty, self._dirty = self._dirty, set()
+                partial = dirty is not None and self.store.partial_snapshots()
+                if partial:
+                    nodes = [node for node in nodes if node.pubkey in dirty]
+                views = [
+                    SimpleNamespace(
+                        pubkey=node.pubkey,
+                        archetype=node.archetype,
+                        mempool=list(node.mempool),
+                        chain=node.chain,
+                        progress=node.progress,
+                        reputation=node.reputation,
+                        consensus_history=dict(node.consensus_history),
+                    )
+                    for node in nodes
+                ]
+                seq = self.journal_seq
+                self._write_pending()
+                self.store.rotate()
+                self._journal_entries = 0
+        return seq, views, partial, dirty
+
+    @timed
     def save_state_to_disk(self):
-        """Serializes the engine state to disk."""
-        state = {
-            'nodes': {
-                pubkey: {
-                    'pubkey': node.pubkey,
-                    'archetype': node.archetype,
-                    'mempool': [asdict(txn) for txn in node.mempool],
-                    'chain': [{
-                        'hash': block.hash,
-                        'txns': [asdict(txn) for txn in block.txns],
-                        'type': block.type
-                    } for block in node.chain],
-                    'progress': node.progress,
-                    'reputation': node.reputation,
-                    'consensus_history': node.consensus_history
-                } for pubkey, node in self.nodes.items()
-            }
-        }
-        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
-        with open(self.state_file, 'w') as f:
-            json.dump(state, f, default=str)  # Handle float timestamps
+        """Writes a compacted snapshot of the engine state and retires the old journal.
 
+        With a store that supports it, only the nodes changed since the last
+        snapshot are written.
+        """
+        with self._compact_lock, self._write_transaction():
+            seq, views, partial, dirty = self._capture_state()
+            try:
+                self.store.write_snapshot(seq, views, partial=partial)
+            except BaseException:
+                # The captured changes are not on disk; the next snapshot retries them
+                with self._journal_lock:
+                    if partial and self._dirty is not None:
+                        self._dirty |= dirty
+                    else:
+                        self._dirty = None
+                raise
+
+    @timed
     def load_state_from_disk(self):
-        """Loads the engine state from disk."""
-        if os.path.exists(self.state_file):
-            with open(self.state_file, 'r') as f:
-                state = json.load(f)
-                for pubkey, node_data in state['nodes'].items():
-                    node = Node(
-                        pubkey=node_data['pubkey'],
-                        archetype=node_data['archetype'],
-                        mempool=[Transaction(**txn) for txn in node_data['mempool']],
-                        chain=[Block(**block) for block in node_data['chain']],
-                        progress=node_data['progress'],
-                        reputation=node_data['reputation'],
-                        consensus_history=node_data['consensus_history']
-                    )
-                    self.nodes[pubkey] = node
+        """Loads the latest snapshot and replays the journal written after it."""
+        # Blocks are content-addressed, so chains that agree on history are
+        # rebuilt onto the same shared cells.
+        cells: Dict[str, Chain] = {}
+
+        def load_chain(blocks: List[Dict]) -> Chain:
+            chain = Chain()
+            for block_data in blocks:
+                block = None
+                if 'prev_hash' not in block_data:
+                    # Unlinked blocks from the original state file carry positional
+                    # hashes ("0-att-block") that say nothing about their contents
+                    block = block_from_dict(block_data)
+                    block = Block.create(block.txns, block.type, chain.tip_hash)
+                block_hash = block.hash if block else block_data['hash']
+                cell = cells.get(block_hash)
+                if cell is None or cell.parent is not chain:
+                    cell = chain.with_block(block or block_from_dict(block_data))
+                    cells[block_hash] = cell
+                chain = cell
+            return chain
+
+        snapshot_seq, state = self.store.load_snapshot()
+        self._dirty = set() if self.store.partial_snapshots() else None
+        if state is not None:
+            for pubkey, node_data in state['nodes'].items():
+                chain = node_data['chain']
+                self._adopt_node(Node(
+                    pubkey=node_data['pubkey'],
+                    archetype=node_data['archetype'],
+                    mempool=[txn_from_dict(txn) for txn in node_data['mempool']],
+                    chain=chain if isinstance(chain, Chain) else load_chain(chain),
+                    progress=node_data['progress'],
+                    reputation=node_data['reputation'],
+                    consensus_history=node_data['consensus_history']
+                ))
+        self.journal_seq = snapshot_seq
+
+        for event in self.store.read_events(snapshot_seq) or []:
+            self._replay_event(event)
+            self.journal_seq = event['seq']
+            self._journal_entries += 1
+        self.changes.reset(self.journal_seq, self.nodes)
+
+# --- MINING SCHEDULER ---
+class MiningScheduler:
+    """Mines nodes with new mempool activity on background OS threads.
+
+    The engine reports each node whose mempool grew or whose chain was
+    replaced. A node is queued at most once however many reports arrive
+    before its turn (coalescing), and mined at most once per
+    ``min_interval`` seconds. A report that lands while the node is being
+    mined queues it again, so no activity is left unmined. With no workers
+    nothing runs in the background and mine_now() is the only way to mine.
+    """
+
+    def __init__(self, engine: POKEngine, workers: int = 2, min_interval: float = 1.0):
+        self.engine = engine
+        self.workers = workers
+        self.min_interval = min_interval
+        self.runs = 0
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, str]] = []  # (due, pubkey), one entry per queued node
+        self._queued: Dict[str, float] = {}
+        self._mining: set = set()
+        self._again: set = set()
+        self._last_run: Dict[str, float] = {}
+        self._results: Dict[str, Dict] = {}
+        self._threads: List = []  # Handles from start_os_thread
+        self._stopped = False
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def start(self):
+        if self.workers <= 0 or self._threads:
+            return
+        self.engine.activity_listeners.append(self.notify)
+        for i in range(self.workers):
+            # Real OS threads even under gevent: a mining run holds the CPU
+            self._threads.append(start_os_thread(self._work, f'pok-miner-{i}'))
+
+    def stop(self):
+        if self.notify in self.engine.activity_listeners:
+            self.engine.activity_listeners.remove(self.notify)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def notify(self, pubkey: str):
+        """Marks a node as having new activity. Cheap; called under engine locks."""
+        with self._cond:
+            if pubkey in self._mining:
+                self._again.add(pubkey)
+            else:
+                self._enqueue(pubkey)
+
+    def _enqueue(self, pubkey: str):
+        # Caller holds _cond
+        if pubkey in self._queued:
+            return
+        due = max(time.monotonic(), self._last_run.get(pubkey, float('-inf')) + self.min_interval)
+        self._queued[pubkey] = due
+        heapq.heappush(self._heap, (due, pubkey))
+        self._cond.notify()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    remaining = self._heap[0][0] - time.monotonic()
+                    if remaining > 0:
+                        self._cond.wait(remaining)
+                        continue
+                    _, pubkey = heapq.heappop(self._heap)
+                    del self._queued[pubkey]
+                    self._mining.add(pubkey)
+                    break
+            result = self.mine_now(pubkey)
+            with self._cond:
+                self._mining.discard(pubkey)
+                self._last_run[pubkey] = time.monotonic()
+                if pubkey in self._again:
+                    self._again.discard(pubkey)
+                    self._enqueue(pubkey)
+
+    def mine_now(self, pubkey: str) -> Dict:
+        """Proposes both block types for a node on the calling thread."""
+        node = self.engine.nodes.get(pubkey)
+        if node is None:
+            result = {"error": "Node not found"}
+        else:
+            before = len(node.chain)
+            try:
+                self.engine.propose_attestation_block(node)
+                self.engine.propose_pok_block(node)
+                result = {"blocks": len(node.chain) - before}
+            except Exception as exc:  # Keep the worker alive; reported by status()
+                result = {"error": str(exc)}
+        result["finished_at"] = time.time()
+        with self._cond:
+            self.runs += 1
+            self._results[pubkey] = result
+        return result
+
+    def status(self, pubkey: Optional[str] = None) -> Dict:
+        """Scheduler totals, or one node's state and last mining result."""
+        with self._cond:
+            if pubkey is None:
+                return {
+                    "workers": len(self._threads),
+                    "queued": len(self._queued),
+                    "mining": len(self._mining),
+                    "runs": self.runs,
+                }
+            if pubkey in self._mining:
+                state = "mining"
+            elif pubkey in self._queued:
+                state = "queued"
+            else:
+                state = "idle"
+            status = {"pubkey": pubkey, "state": state, "last_run": self._results.get(pubkey)}
+            if state == "queued":
+                status["due_in"] = max(0.0, self._queued[pubkey] - time.monotonic())
+            return status
 
 # --- APPLICATION INITIALIZATION ---
 app = Flask(__name__)
 CORS(app)
-engine = POKEngine('pok_curriculum_trimmed.json')
+# POK_STATE_STORE=sqlite:///data/app_state.db lets several worker processes
+# (e.g. gunicorn -w 4) serve the same state. POK_PERSISTENCE picks one of
+# PERSISTENCE_POLICIES for the single-process file store, POK_FSYNC one of
+# FSYNC_POLICIES for either store.
+engine = POKEngine(
+    'pok_curriculum_trimmed.json',
+    store=open_store(os.environ.get('POK_STATE_STORE'), fsync=os.environ.get('POK_FSYNC')),
+    persistence=os.environ.get('POK_PERSISTENCE', 'write-through'),
+)
+atexit.register(engine.close)
+# Nodes with new mempool activity are mined off the request path.
+# POK_MINING_WORKERS=0 turns background mining off; POK_MINING_INTERVAL is
+# the minimum number of seconds between two runs for the same node.
+scheduler = MiningScheduler(
+    engine,
+    workers=int(os.environ.get('POK_MINING_WORKERS', 2)),
+    min_interval=float(os.environ.get('POK_MINING_INTERVAL', 1.0)),
+)
+# The miners start only in serving processes (below, and gunicorn.conf.py),
+# so scripts importing this module do not get background threads.
+
+def start_serving():
+    scheduler.start()
+    atexit.register(scheduler.stop)
+
+# POK_PROFILER=1 enables the /profile routes for sampling a live server
+app.config['PROFILER_ENABLED'] = os.environ.get('POK_PROFILER') == '1'
+profiler = SamplingProfiler()
+
+@app.before_request
+def refresh_engine():
+    g.request_start = time.perf_counter()
+    engine.refresh()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = (('method', request.method), ('route', route))
+    engine.metrics.observe(('pok_http_request_seconds', labels), time.perf_counter() - g.request_start)
+    engine.metrics.inc(('pok_http_requests_total', labels + (('status', str(response.status_code)),)))
+    return response
 
 # --- API ROUTES ---
 @app.route('/init', methods=['GET'])
@@ -336,38 +2663,192 @@ def sync_route():
 
 @app.route('/block/propose/<pubkey>', methods=['POST'])
 def propose_block_route(pubkey):
+    # Queues the node for the background miners; poll /block/status/<pubkey>
+    # or listen on /events for the result. Mines inline when they are off.
     node = engine.nodes.get(pubkey)
-    if node:
-        engine.propose_attestation_block(node)
-        engine.propose_pok_block(node)
+    if not node:
+        return jsonify({"error": "Node not found"}), 404
+    if not scheduler.running:
+        scheduler.mine_now(pubkey)
         return jsonify({"chain_length": len(node.chain)}), 200
-    return jsonify({"error": "Node not found"}), 404
+    scheduler.notify(pubkey)
+    return jsonify(scheduler.status(pubkey)), 202
+
+@app.route('/block/status', methods=['GET'])
+@app.route('/block/status/<pubkey>', methods=['GET'])
+def block_status_route(pubkey=None):
+    if pubkey is not None and pubkey not in engine.nodes:
+        return jsonify({"error": "Node not found"}), 404
+    status = scheduler.status(pubkey)
+    if pubkey is not None:
+        status["chain_length"] = len(engine.nodes[pubkey].chain)
+    return jsonify(status), 200
 
 @app.route('/txn/create', methods=['POST'])
 def create_txn_route():
     data = request.json
+    error = txn_record_error(data)
+    if error:
+        return jsonify({"error": error}), 400
     txn = engine.create_txn(data['qid'], data['pubkey'], data['ans'], time.time(), data['type'])
     node = engine.nodes.get(data['pubkey'])
     if node:
-        node.mempool.append(txn)
-        engine.save_state_to_disk()
-        return jsonify({"status": "success", "txn_id": txn.id}), 201
+        engine.add_txns(node, [txn])
+        return jsonify({"status": "success", "txn_id": txn_id_to_str(txn.id)}), 201
     return jsonify({"error": "Node not found"}), 404
 
+@app.route('/txn/batch', methods=['POST'])
+def create_txn_batch_route():
+    data = request.json
+    records = data.get('txns') if isinstance(data, dict) else data
+    if not isinstance(records, list):
+        return jsonify({"error": "Expected a list of transactions"}), 400
+    results = engine.submit_txns(records)
+    accepted = sum(1 for r in results if r.get('status') == 'success')
+    return jsonify({"accepted": accepted, "results": results}), 200
+
 @app.route('/state/<pubkey>', methods=['GET'])
 def get_state(pubkey):
+    # ?fields=progress,reputation selects keys; ?limit=N pages chain and
+    # mempool, continued with the chain_cursor/mempool_cursor under "page".
     node = engine.nodes.get(pubkey)
-    if node:
-        return jsonify(asdict(node)), 200
-    return jsonify({"error": "Node not found"}), 404
+    if not node:
+        return jsonify({"error": "Node not found"}), 404
+    fields = NODE_FIELDS
+    if request.args.get('fields'):
+        fields = request.args['fields'].split(',')
+        unknown = [name for name in fields if name not in NODE_FIELDS]
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    limit = request.args.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or int(limit) < 1:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = int(limit)
+    try:
+        with engine.node_locks(node):
+            state = node_state(
+                node, fields, limit,
+                request.args.get('chain_cursor'), request.args.get('mempool_cursor'),
+            )
+    except StaleCursor as e:
+        return jsonify({"error": str(e)}), 410
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(state), 200
+
+# Each open stream holds its connection, and under a thread-per-request
+# server one thread, for as long as the dashboard stays open; the Dockerfile
+# runs gevent workers so idle streams only cost a parked greenlet.
+SSE_KEEPALIVE_INTERVAL = 15.0
+SSE_POLL_INTERVAL = 1.0  # Shared stores: how often a worker looks for other workers' changes
+
+_streams_lock = threading.Lock()
+_open_streams = 0
+_store_poller: Optional[threading.Thread] = None
+
+def _poll_store():
+    # One loop per worker catches up with the shared store, which publishes
+    # other workers' changes into engine.changes; streams only wait on that.
+    while True:
+        time.sleep(SSE_POLL_INTERVAL)
+        if _open_streams:
+            try:
+                engine.refresh()
+            except Exception as exc:  # Keep polling; the next round retries
+                sys.stderr.write(f"Store poll failed: {exc}\n")
+
+@contextmanager
+def _streaming():
+    global _open_streams, _store_poller
+    with _streams_lock:
+        _open_streams += 1
+        if _store_poller is None and engine.store.shared:
+            _store_poller = threading.Thread(target=_poll_store, name='pok-store-poller', daemon=True)
+            _store_poller.start()
+    try:
+        yield
+    finally:
+        with _streams_lock:
+            _open_streams -= 1
+
+@app.route('/events', methods=['GET'])
+def stream_events():
+    # Server-Sent Events: one compact frame per state change, optionally only
+    # those involving ?pubkey=. Resumes after Last-Event-ID (or ?since=).
+    pubkey = request.args.get('pubkey')
+    token = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        seq = int(token) if token else engine.changes.last_seq
+    except ValueError:
+        return jsonify({"error": "Resume token must be an event id"}), 400
+
+    def stream(seq):
+        with _streaming():
+            yield b': connected\n\n'
+            quiet_since = time.monotonic()
+            while True:
+                frames, latest = engine.changes.changes_after(seq, pubkey)
+                if frames is None:
+                    frames = [ChangeFeed.reset_frame(latest)]
+                if frames:
+                    yield b''.join(frames)
+                    quiet_since = time.monotonic()
+                seq = latest
+                # Changes for other pubkeys wake the stream without a frame
+                quiet = time.monotonic() - quiet_since
+                if not engine.changes.wait(seq, timeout=max(0.0, SSE_KEEPALIVE_INTERVAL - quiet)):
+                    yield b': keepalive\n\n'
+                    quiet_since = time.monotonic()
+
+    return Response(stream(seq), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route('/curriculum', methods=['GET'])
 def get_curriculum():
-    return jsonify([asdict(q) for q in engine.curriculum]), 200
+    # The curriculum never changes after load: serialize it once and let
+    # clients revalidate with If-None-Match.
+    body, etag = engine.curriculum.json_body()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 @app.route('/nodes', methods=['GET'])
 def get_nodes():
     return jsonify(list(engine.nodes.keys())), 200
 
+@app.route('/checkpoint', methods=['POST'])
+def checkpoint_route():
+    engine.checkpoint()
+    return jsonify({"status": "checkpointed", "journal_seq": engine.journal_seq}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    return Response(engine.metrics_text(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profile/start', methods=['POST'])
+def profile_start_route():
+    # ?interval=seconds between samples (default 0.005)
+    if not app.config['PROFILER_ENABLED']:
+        return jsonify({"error": "Profiler disabled; start the server with POK_PROFILER=1"}), 403
+    interval = request.args.get('interval', default=0.005, type=float)
+    if not 0 < interval <= 1:
+        return jsonify({"error": "interval must be in (0, 1] seconds"}), 400
+    if not profiler.start(interval):
+        return jsonify({"error": "Profiler already running"}), 409
+    return jsonify({"status": "sampling", "interval": interval}), 200
+
+@app.route('/profile/stop', methods=['POST'])
+def profile_stop_route():
+    # Collapsed stacks, ready for flamegraph.pl or speedscope
+    if not app.config['PROFILER_ENABLED']:
+        return jsonify({"error": "Profiler disabled; start the server with POK_PROFILER=1"}), 403
+    if not profiler.running:
+        return jsonify({"error": "Profiler not running"}), 409
+    return Response(profiler.stop(), mimetype='text/plain')
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    start_serving()
+    # No reloader: its parent process would load the single-process file
+    # store and start miners alongside the serving child
+    app.run(debug=True, threaded=True, use_reloader=False)
\ No newline at end of file
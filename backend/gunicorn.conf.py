@@ -0,0 +1,9 @@
+# gunicorn.conf.py
+# Importing app does not start the block miners; each worker starts its own
+# once it has loaded the app. They run on OS threads outside gevent's event
+# loop, so a mining run does not stall the worker's requests and streams.
+
+
+def post_worker_init(worker):
+    import app
+    app.start_serving()
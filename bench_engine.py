@@ -0,0 +1,446 @@
+# bench_engine.py - benchmark suite for POKEngine hot paths
+# Run from backend/ so app.py and the curriculum resolve:
+#   cd backend && PYTHONPATH=. python ../bench_engine.py                  # compare with the baseline
+#   cd backend && PYTHONPATH=. python ../bench_engine.py --save-baseline  # record a new baseline
+#   cd backend && PYTHONPATH=. python ../bench_engine.py --txn-creation   # create_txn cache comparison
+#
+# Every benchmark is timed at increasing sizes of one dimension (node count,
+# chain length, mempool size, ...) and a power law is fitted to the time per
+# operation. The fitted exponent is the scaling curve's slope on a log-log
+# plot: about 0 for O(1) work, 1 for O(n), 2 for O(n^2). The run fails (exit
+# status 1) when a benchmark scales worse than its declared complexity, or
+# is slower or scales worse than the saved baseline, so quadratic
+# regressions are caught before deploy.
+
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+# The module-level app engine stays in memory; routes are pointed at bench engines
+os.environ.setdefault('POK_PERSISTENCE', 'none')
+import app as app_module
+from app import POKEngine, Transaction, Payload, Block
+
+N_TXNS = 200_000
+ANSWERS = ['A', 'B', 'C', 'D', 'E']
+SIZES = (125, 250, 500, 1000, 2000)
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+# Slack on fitted exponents: timing noise at small sizes easily moves them by 0.2
+EXPONENT_SLACK = 0.4
+
+Benchmark = namedtuple('Benchmark', 'name dimension expected setup')
+BENCHMARKS = []
+
+
+def benchmark(name: str, dimension: str, expected: int):
+    """Registers setup(n) -> (run, ops); run() performs ops operations at size n.
+
+    expected is the exponent of the time per operation in n: 0 for O(1)
+    operations, 1 for O(n). setup runs again before every timed repeat, so
+    run() may consume the state it was given.
+    """
+    def register(setup):
+        BENCHMARKS.append(Benchmark(name, dimension, expected, setup))
+        return setup
+    return register
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def time_per_op(setup, n: int, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        run, ops = setup(n)
+        start = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - start) / ops)
+    return min(times)
+
+
+def fit_exponent(times: dict) -> float:
+    """Least-squares slope of log(time) against log(size)."""
+    xs = [math.log(n) for n in times]
+    ys = [math.log(max(t, 1e-12)) for t in times.values()]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    var = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var if var else 0.0
+
+
+# --- Fixtures ---
+
+def new_engine(**kwargs) -> POKEngine:
+    kwargs.setdefault('persistence', 'none')
+    return POKEngine('pok_curriculum_trimmed.json', **kwargs)
+
+
+def add_attesters(engine: POKEngine, count: int = 20) -> list:
+    return [engine.add_node(f'attester_{i}', 'diligent').pubkey for i in range(count)]
+
+
+def attestations(engine: POKEngine, pubkeys: list, n: int, qids=('q1',), answers=('A',)) -> list:
+    return engine.create_txns([
+        (qids[i % len(qids)], pubkeys[i % len(pubkeys)], answers[i % len(answers)], float(i), 'attestation')
+        for i in range(n)
+    ])
+
+
+def build_chain(engine: POKEngine, node, length: int):
+    for i in range(length):
+        txn = engine.create_txn(f'q{i}', node.pubkey, 'A', float(i), 'completion')
+        node.chain = node.chain.with_block(Block.create([txn], 'pok', node.chain.tip_hash))
+
+
+def mempool_pair(n: int) -> POKEngine:
+    """Two nodes sharing the same n pending transactions; node1 has five more."""
+    engine = new_engine()
+    node1, node2 = engine.add_node('node1', 'aces'), engine.add_node('node2', 'aces')
+    shared = attestations(engine, add_attesters(engine), n, qids=[f'q{i}' for i in range(50)])
+    engine.add_txns(node1, shared)
+    engine.add_txns(node2, shared)
+    engine.add_txns(node1, attestations(engine, ['node1'], 5, qids=('q_new',)))
+    return engine
+
+
+_scratch = None  # TemporaryDirectory of the benchmark being run, see run_suite
+
+
+def scratch_dir() -> str:
+    """A fresh directory, removed when the current benchmark finishes."""
+    return tempfile.mkdtemp(dir=_scratch)
+
+
+def populated_store(n: int, state_dir: str) -> POKEngine:
+    """n nodes sharing a 20-block chain, each with 10 pending transactions."""
+    engine = new_engine(persistence='write-through', state_file=os.path.join(state_dir, 'app_state.json'))
+    engine.snapshot_interval = float('inf')
+    first = engine.add_node('pub_0', 'diligent')
+    build_chain(engine, first, 20)
+    for i in range(n):
+        node = engine.add_node(f'pub_{i}', 'diligent')
+        node.chain = first.chain
+        node.mempool.extend(engine.create_txns(
+            [(f'q{j}', node.pubkey, 'A', float(j), 'completion') for j in range(10)]
+        ))
+    return engine
+
+
+# --- Engine benchmarks ---
+
+@benchmark('create_txn', 'txns', 0)
+def setup_create_txn(n):
+    engine = new_engine()
+    specs = [(f'q{i % 50}', f'pub_{i % 40}', ANSWERS[i % 5], float(i), 'completion') for i in range(n)]
+    return lambda: [engine.create_txn(*spec) for spec in specs], n
+
+
+@benchmark('calculate_convergence', 'attestations on the question', 0)
+def setup_convergence(n):
+    engine = new_engine()
+    node = engine.add_node('owner', 'aces')
+    engine.add_txns(node, attestations(engine, add_attesters(engine), n, answers=ANSWERS))
+    engine.calculate_convergence(node, 'q1')
+    return lambda: [engine.calculate_convergence(node, 'q1') for _ in range(100)], 100
+
+
+@benchmark('calculate_convergence (weighted)', 'attestations on the question', 1)
+def setup_weighted_convergence(n):
+    engine = new_engine()
+    node = engine.add_node('owner', 'aces')
+    engine.add_txns(node, attestations(engine, add_attesters(engine), n, answers=ANSWERS))
+    cache = node.question_index.convergence
+
+    def run():
+        for _ in range(10):
+            cache.clear()  # Measures recomputation, as after a reputation change
+            engine.calculate_convergence(node, 'q1', weighted=True)
+    return run, 10
+
+
+@benchmark('calculate_convergence (weighted, cached)', 'attestations on the question', 0)
+def setup_cached_weighted_convergence(n):
+    engine = new_engine()
+    node = engine.add_node('owner', 'aces')
+    engine.add_txns(node, attestations(engine, add_attesters(engine), n, answers=ANSWERS))
+    engine.calculate_convergence(node, 'q1', weighted=True)
+    return lambda: [engine.calculate_convergence(node, 'q1', weighted=True) for _ in range(100)], 100
+
+
+@benchmark('propose_attestation_block', 'mempool size', 1)
+def setup_attestation_block(n):
+    engine = new_engine()
+    node = engine.add_node('owner', 'aces')
+    qids = [f'q{i}' for i in range(50)]
+    engine.add_txns(node, attestations(engine, add_attesters(engine), n, qids=qids))
+    return lambda: engine.propose_attestation_block(node), 1
+
+
+@benchmark('propose_pok_block', 'mempool size', 1)
+def setup_pok_block(n):
+    # n/5 own completions, each backed by four attestations
+    engine = new_engine()
+    node = engine.add_node('owner', 'aces')
+    qids = [f'q{i}' for i in range(n // 5)]
+    completions = engine.create_txns([(qid, 'owner', 'A', 0.0, 'completion') for qid in qids])
+    engine.add_txns(node, completions + attestations(engine, add_attesters(engine), n - len(qids), qids=qids))
+    return lambda: engine.propose_pok_block(node), 1
+
+
+@benchmark('_update_reputation', 'attestations on the question', 1)
+def setup_update_reputation(n):
+    engine = new_engine()
+    node = engine.add_node('owner', 'aces')
+    completion = engine.create_txn('q1', 'owner', 'A', 0.0, 'completion')
+    engine.add_txns(node, [completion] + attestations(engine, add_attesters(engine), n, answers=('A', 'A', 'B')))
+    return lambda: engine._update_reputation(node, [completion]), 1
+
+
+@benchmark('sync_nodes (mempools)', 'mempool size', 0)
+def setup_sync_mempools(n):
+    engine = mempool_pair(n)
+    return lambda: engine.sync_nodes(engine.nodes['node1'], engine.nodes['node2']), 1
+
+
+@benchmark('sync_nodes (chains)', 'chain length', 0)
+def setup_sync_chains(n):
+    # node2 is five blocks behind node1 on the same history
+    engine = new_engine()
+    node1, node2 = engine.add_node('node1', 'aces'), engine.add_node('node2', 'aces')
+    build_chain(engine, node1, n - 5)
+    node2.chain = node1.chain
+    build_chain(engine, node1, 5)
+    engine.calculate_convergence(node2, 'q1')  # Builds node2's question index
+    return lambda: engine.sync_nodes(node1, node2), 1
+
+
+@benchmark('save_state_to_disk', 'nodes', 1)
+def setup_save_state(n):
+    engine = populated_store(n, scratch_dir())
+    return engine.save_state_to_disk, 1
+
+
+@benchmark('save_state_to_disk (one node changed)', 'nodes', 1)
+def setup_save_state_partial(n):
+    # Locking and the manifest still scale with n; node files and blocks do not
+    engine = populated_store(n, scratch_dir())
+    engine.save_state_to_disk()
+    node = engine.nodes['pub_0']
+    return lambda: (engine.add_txns(node, [engine.create_txn('q1', 'pub_0', 'B', 0.0, 'completion')]),
+                    engine.save_state_to_disk()), 1
+
+
+@benchmark('load_state_from_disk', 'nodes', 1)
+def setup_load_state(n):
+    engine = populated_store(n, scratch_dir())
+    engine.save_state_to_disk()
+    return lambda: new_engine(persistence='write-through', state_file=engine.state_file), 1
+
+
+# --- HTTP routes (Flask test client against a bench engine) ---
+
+def route_client(engine: POKEngine):
+    app_module.engine = engine
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
+
+
+@benchmark('POST /txn/create', 'nodes', 0)
+def setup_txn_create_route(n):
+    engine = new_engine()
+    for i in range(n):
+        engine.add_node(f'pub_{i}', 'diligent')
+    client = route_client(engine)
+    bodies = [{'qid': 'q1', 'pubkey': f'pub_{i % n}', 'ans': 'A', 'type': 'completion'} for i in range(50)]
+    return lambda: [client.post('/txn/create', json=body) for body in bodies], 50
+
+
+@benchmark('GET /state (first page)', 'chain length', 0)
+def setup_state_page_route(n):
+    engine = new_engine()
+    build_chain(engine, engine.add_node('owner', 'aces'), n)
+    client = route_client(engine)
+    return lambda: [client.get('/state/owner?limit=20') for _ in range(20)], 20
+
+
+@benchmark('GET /state (full)', 'chain length', 1)
+def setup_state_route(n):
+    engine = new_engine()
+    build_chain(engine, engine.add_node('owner', 'aces'), n)
+    client = route_client(engine)
+    return lambda: [client.get('/state/owner') for _ in range(5)], 5
+
+
+@benchmark('POST /sync', 'mempool size', 0)
+def setup_sync_route(n):
+    client = route_client(mempool_pair(n))
+    return lambda: client.post('/sync', json={'pubkey1': 'node1', 'pubkey2': 'node2'}), 1
+
+
+@benchmark('GET /nodes', 'nodes', 1)
+def setup_nodes_route(n):
+    engine = new_engine()
+    for i in range(n):
+        engine.add_node(f'pub_{i}', 'diligent')
+    client = route_client(engine)
+    return lambda: [client.get('/nodes') for _ in range(20)], 20
+
+
+# --- Suite ---
+
+def run_suite(benchmarks: list, sizes, repeat: int) -> dict:
+    global _scratch
+    results = {}
+    for bench in benchmarks:
+        with tempfile.TemporaryDirectory(prefix='pok-bench-') as _scratch:
+            times = {n: time_per_op(bench.setup, n, repeat) for n in sizes}
+        _scratch = None
+        results[bench.name] = {
+            'dimension': bench.dimension,
+            'expected': bench.expected,
+            'times': times,
+            'exponent': fit_exponent(times),
+        }
+    return results
+
+
+def check(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions: worse than declared complexity, or slower / steeper than the baseline."""
+    problems = []
+    for name, result in results.items():
+        if result['exponent'] > result['expected'] + EXPONENT_SLACK:
+            problems.append(f"{name}: scales as n^{result['exponent']:.2f}, expected n^{result['expected']}")
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['exponent'] > base['exponent'] + EXPONENT_SLACK:
+            problems.append(f"{name}: scales as n^{result['exponent']:.2f}, baseline n^{base['exponent']:.2f}")
+        # Geometric mean over the sizes both runs share, so one noisy size does not fail the run
+        ratios = [seconds / base['times'][str(n)] for n, seconds in result['times'].items() if str(n) in base['times']]
+        if ratios:
+            slowdown = math.exp(sum(map(math.log, ratios)) / len(ratios))
+            if slowdown > tolerance:
+                problems.append(f"{name}: x{slowdown:.2f} slower than baseline")
+    return problems
+
+
+def report_suite(results: dict, baseline: dict):
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        print(f"\n{name}  [{result['dimension']}]  expected O(n^{result['expected']})")
+        for n, seconds in result['times'].items():
+            base_seconds = base.get('times', {}).get(str(n))
+            versus = f"x{seconds / base_seconds:.2f} vs baseline" if base_seconds else ''
+            print(f"  n={n:<6} {seconds * 1e6:12.1f} us/op  {versus}")
+        base_exponent = f" (baseline {base['exponent']:.2f})" if base else ''
+        print(f"  scaling exponent {result['exponent']:.2f}{base_exponent}")
+
+
+def write_curves(path: str, results: dict):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['benchmark', 'dimension', 'n', 'seconds_per_op', 'exponent'])
+        for name, result in results.items():
+            for n, seconds in result['times'].items():
+                writer.writerow([name, result['dimension'], n, seconds, result['exponent']])
+
+
+# --- create_txn answer cache comparison ---
+
+def bench_txn_creation(engine: POKEngine, n: int = N_TXNS) -> dict:
+    """Simulation-scale transaction creation: MCQ letters from 40 nodes."""
+    rng = random.Random(42)
+    specs = [
+        (f'q{i % 50}', f'pub_{i % 40}', rng.choice(ANSWERS), float(i), 'completion')
+        for i in range(n)
+    ]
+
+    def uncached():
+        # create_txn without the answer digest cache
+        for qid, pubkey, ans, t, txn_type in specs:
+            ans = str(ans)
+            Transaction(
+                id=engine._txn_id(),
+                timestamp=t,
+                owner_pubkey=pubkey,
+                question_id=qid,
+                type=txn_type,
+                payload=Payload.intern(ans, hashlib.sha256(ans.encode()).digest()),
+            )
+
+    def per_call():
+        for spec in specs:
+            engine.create_txn(*spec)
+
+    def bulk():
+        engine.create_txns(specs)
+
+    return {
+        'uncached create_txn': best_of(uncached),
+        'cached create_txn': best_of(per_call),
+        'create_txns (bulk)': best_of(bulk),
+    }
+
+
+def report(title: str, results: dict, n: int):
+    print(f"\n{title} ({n:,} txns)")
+    baseline = next(iter(results.values()))
+    for name, seconds in results.items():
+        rate = n / seconds if seconds else float('inf')
+        print(f"  {name:<24} {seconds * 1000:9.1f} ms  {rate:12,.0f} txn/s  x{baseline / seconds:.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='POKEngine benchmark suite')
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help='comma separated sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='timed repeats per size (best is kept)')
+    parser.add_argument('--only', default='', help='run benchmarks whose name contains this')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='write this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=2.0,
+                        help='allowed slowdown vs baseline (geometric mean over sizes)')
+    parser.add_argument('--csv', help='write the scaling curves to this CSV file')
+    parser.add_argument('--txn-creation', action='store_true', help='run the create_txn cache comparison')
+    args = parser.parse_args()
+
+    if args.txn_creation:
+        report("Transaction creation", bench_txn_creation(new_engine()), N_TXNS)
+        sys.exit(0)
+
+    sizes = [int(n) for n in args.sizes.split(',')]
+    results = run_suite([b for b in BENCHMARKS if args.only in b.name], sizes, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    report_suite(results, baseline)
+    if args.csv:
+        write_curves(args.csv, results)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'sizes': sizes, 'python': sys.version.split()[0], 'results': results}, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        sys.exit(0)
+
+    problems = check(results, baseline, args.tolerance)
+    if problems:
+        print("\nRegressions:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("\nNo regressions" + ("" if baseline else " (no baseline to compare against)"))
@@ -0,0 +1,131 @@
+# sweep_sim.py - parallel Monte Carlo parameter sweeps over verify_sim
+#
+# Runs seeded replicates of the simulation for every point of a grid over
+# the engine's consensus parameters, fanned out across a process pool. Each
+# trial's metrics are appended to a CSV as soon as it finishes, then the
+# replicates of each grid point are summarized with 95% confidence intervals.
+# Run from backend/ like the other scripts:
+#   cd backend && PYTHONPATH=. python ../sweep_sim.py --quorum 0.6,0.7,0.8 --bonus 1.5,2.5 --replicates 20
+#
+# Replicate r uses seed base_seed + r at every grid point, so points are
+# compared on the same random draws.
+
+import argparse
+import csv
+import itertools
+import os
+import statistics
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import verify_sim
+
+PARAMS = ('quorum_conv_thresh', 'thought_leader_thresh', 'thought_leader_bonus')
+METRICS = ('accuracy', 'latency', 'fragmentation')
+COLUMNS = ('engine', 'nodes', 'days', *PARAMS, 'seed', *METRICS, 'seconds')
+
+# Two-sided 95% Student t critical values by degrees of freedom; normal beyond 30
+T_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def run_trial(trial: dict) -> dict:
+    """Runs one seeded trial in a worker process, persistence disabled."""
+    params = {name: trial[name] for name in PARAMS}
+    start = time.perf_counter()
+    if trial['engine'] == 'vectorized':
+        from verify_sim_vectorized import run_vectorized
+        metrics = run_vectorized(trial['nodes'], trial['days'], seed=trial['seed'], **params)
+    else:
+        metrics = verify_sim.run_simulation(
+            trial['days'], trial['nodes'], seed=trial['seed'], verbose=False, write_report=False,
+            persistence='none', **params,
+        )
+    return dict(trial, **metrics, seconds=time.perf_counter() - start)
+
+
+def confidence_interval(values: list) -> tuple:
+    """(mean, half-width of the 95% confidence interval) of the replicates."""
+    mean = statistics.mean(values)
+    if len(values) < 2:
+        return mean, float('nan')
+    df = len(values) - 1
+    t = T_95[df - 1] if df <= len(T_95) else 1.960
+    return mean, t * statistics.stdev(values) / len(values) ** 0.5
+
+
+def sweep(grid: dict, replicates: int, base_seed: int, out_path: str, workers=None,
+          engine='object', nodes=verify_sim.TOTAL_NODES, days=verify_sim.SIM_DAYS) -> list:
+    """Runs every grid point `replicates` times, streaming rows to out_path; returns the rows."""
+    trials = [
+        dict(engine=engine, nodes=nodes, days=days, **dict(zip(PARAMS, point)), seed=base_seed + r)
+        for point in itertools.product(*(grid[name] for name in PARAMS))
+        for r in range(replicates)
+    ]
+    rows = []
+    with open(out_path, 'w', newline='') as f, ProcessPoolExecutor(workers) as pool:
+        writer = csv.DictWriter(f, COLUMNS)
+        writer.writeheader()
+        for done, future in enumerate(as_completed([pool.submit(run_trial, t) for t in trials]), 1):
+            row = future.result()
+            writer.writerow(row)
+            f.flush()
+            rows.append(row)
+            print(f"\r{done}/{len(trials)} trials", end='', flush=True)
+    print()
+    return rows
+
+
+def summarize(rows: list) -> list:
+    """One row per grid point: replicate count plus mean and CI half-width per metric."""
+    groups = defaultdict(list)
+    for row in rows:
+        groups[tuple(row[name] for name in PARAMS)].append(row)
+    summary = []
+    for point, group in sorted(groups.items()):
+        entry = dict(zip(PARAMS, point), replicates=len(group))
+        for metric in METRICS:
+            entry[metric], entry[metric + '_ci95'] = confidence_interval([r[metric] for r in group])
+        summary.append(entry)
+    return summary
+
+
+def parse_values(text: str) -> list:
+    return [float(value) for value in text.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monte Carlo sweep over POKEngine consensus parameters')
+    parser.add_argument('--quorum', type=parse_values, default=[0.7], help='quorum_conv_thresh values, comma separated')
+    parser.add_argument('--leader-thresh', type=parse_values, default=[0.5], help='thought_leader_thresh values')
+    parser.add_argument('--bonus', type=parse_values, default=[2.5], help='thought_leader_bonus values')
+    parser.add_argument('--replicates', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first replicate')
+    parser.add_argument('--nodes', type=int, default=verify_sim.TOTAL_NODES)
+    parser.add_argument('--days', type=int, default=verify_sim.SIM_DAYS)
+    parser.add_argument('--engine', choices=('object', 'vectorized'), default='object')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--out', default='sweep_results.csv')
+    args = parser.parse_args()
+
+    grid = dict(zip(PARAMS, (args.quorum, args.leader_thresh, args.bonus)))
+    print(f"Sweeping {args.replicates} replicates x "
+          f"{len(args.quorum) * len(args.leader_thresh) * len(args.bonus)} grid points "
+          f"on {args.workers or os.cpu_count()} workers -> {args.out}")
+    rows = sweep(grid, args.replicates, args.seed, args.out, args.workers, args.engine, args.nodes, args.days)
+
+    summary = summarize(rows)
+    summary_path = os.path.splitext(args.out)[0] + '_summary.csv'
+    with open(summary_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, list(summary[0]))
+        writer.writeheader()
+        writer.writerows(summary)
+
+    print(f"{'quorum':>6} {'leader':>6} {'bonus':>5}  {'accuracy %':>14} {'latency d':>12} {'fragment. %':>14}")
+    for entry in summary:
+        cells = [f"{entry[m]:.2f} ± {entry[m + '_ci95']:.2f}" for m in METRICS]
+        print(f"{entry['quorum_conv_thresh']:>6} {entry['thought_leader_thresh']:>6} "
+              f"{entry['thought_leader_bonus']:>5}  {cells[0]:>14} {cells[1]:>12} {cells[2]:>14}")
+    print(f"Per-trial rows: {args.out}; summary: {summary_path}")
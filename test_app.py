@@ -2,7 +2,19 @@
 import pytest
 import time
 import math
-from app import app, POKEngine, Node, Transaction, Payload, Block
+import hashlib
+import json
+import random
+import threading
+import os
+
+# The module-level app engine runs in memory, so client tests leave no state behind
+os.environ.setdefault('POK_PERSISTENCE', 'none')
+from app import (
+    app, POKEngine, Node, Transaction, Payload, Block, Chain, MemoryStateStore, MiningScheduler, SamplingProfiler, SQLiteStateStore,
+    StaleCursor,
+    block_from_dict, answer_payload, node_state, read_checked, txn_id_to_str,
+)
 
 @pytest.fixture
 def client():
@@ -11,8 +23,8 @@ def client():
         yield client
 
 @pytest.fixture
-def engine():
-    return POKEngine('pok_curriculum_trimmed.json')
+def engine(tmp_path):
+    return POKEngine('pok_curriculum_trimmed.json', state_file=str(tmp_path / 'app_state.json'))
 
 @pytest.fixture
 def sample_node(engine):
@@ -35,6 +47,132 @@ def test_add_node(client):
     assert data['status'] == 'node added'
     assert data['pubkey'] == 'test_pubkey'
 
+def test_txn_create_rejects_invalid_records(client):
+    client.post('/node/add', json={'pubkey': 'typed_pubkey', 'archetype': 'aces'})
+    response = client.post('/txn/create', json={'qid': 5, 'pubkey': 'typed_pubkey', 'ans': 'A', 'type': 'completion'})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'qid must be a string'}
+    response = client.post('/txn/create', json={'qid': 'q1', 'pubkey': 'typed_pubkey', 'ans': 'A', 'type': 'bogus'})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': "Unknown txn type 'bogus'"}
+
+def test_state_rejects_non_integer_limit(client):
+    client.post('/node/add', json={'pubkey': 'limit_pubkey', 'archetype': 'aces'})
+    assert client.get('/state/limit_pubkey?limit=abc').status_code == 400
+    assert client.get('/state/limit_pubkey?limit=2').status_code == 200
+
+def test_txn_batch_route(client):
+    client.post('/node/add', json={'pubkey': 'batch_pubkey', 'archetype': 'aces'})
+    response = client.post('/txn/batch', json={'txns': [
+        {'qid': 'q1', 'pubkey': 'batch_pubkey', 'ans': 'A', 'type': 'completion'},
+        {'qid': 'q1', 'pubkey': 'nobody', 'ans': 'A', 'type': 'completion'},
+        {'qid': 'q2', 'pubkey': 'batch_pubkey', 'type': 'completion'},
+        {'qid': 5, 'pubkey': ['batch_pubkey'], 'ans': 'A', 'type': 'completion'},
+    ]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['accepted'] == 1
+    assert data['results'][0]['status'] == 'success'
+    assert data['results'][1] == {'error': 'Node not found'}
+    assert data['results'][2] == {'error': 'Missing ans'}
+    assert data['results'][3] == {'error': 'qid, pubkey must be strings'}
+
+def test_importing_app_starts_no_miners(client):
+    # Only serving processes start the scheduler; requests then mine inline
+    client.post('/node/add', json={'pubkey': 'inline_pubkey', 'archetype': 'aces'})
+    assert not any(t.name.startswith('pok-miner') for t in threading.enumerate())
+    response = client.post('/block/propose/inline_pubkey')
+    assert response.status_code == 200
+    assert response.get_json() == {'chain_length': 0}
+
+def test_state_fields_and_curriculum_etag(client):
+    client.post('/node/add', json={'pubkey': 'poll_pubkey', 'archetype': 'aces'})
+    response = client.get('/state/poll_pubkey?fields=progress,reputation')
+    assert response.get_json() == {'progress': 0, 'reputation': 1.0}
+    assert client.get('/state/poll_pubkey?fields=secret').status_code == 400
+    first = client.get('/curriculum')
+    assert first.status_code == 200 and first.headers['ETag']
+    again = client.get('/curriculum', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304 and again.data == b''
+
+def test_event_stream_pushes_changes(client):
+    client.post('/node/add', json={'pubkey': 'stream_pubkey', 'archetype': 'aces'})
+    response = client.get('/events?pubkey=stream_pubkey')
+    frames = iter(response.response)
+    assert response.mimetype == 'text/event-stream'
+    assert next(frames) == b': connected\n\n'
+    client.post('/txn/create', json={'qid': 'q1', 'pubkey': 'stream_pubkey', 'ans': 'A', 'type': 'completion'})
+    frame = next(frames).decode()
+    assert frame.startswith('id: ') and '"op": "txns"' in frame and '"question_id": "q1"' in frame
+    response.close()
+
+def test_event_stream_polls_shared_store(client, tmp_path, monkeypatch):
+    # Two engines on one database stand in for two gunicorn workers
+    db = str(tmp_path / 'app_state.db')
+    serving = POKEngine('pok_curriculum_trimmed.json', store=SQLiteStateStore(db))
+    other = POKEngine('pok_curriculum_trimmed.json', store=SQLiteStateStore(db))
+    monkeypatch.setattr('app.engine', serving)
+    monkeypatch.setattr('app.SSE_POLL_INTERVAL', 0.05)
+    refreshed_by = []
+    refresh = serving.refresh
+    monkeypatch.setattr(serving, 'refresh', lambda: refreshed_by.append(threading.current_thread().name) or refresh())
+    responses = [client.get('/events'), client.get('/events')]
+    streams = [iter(response.response) for response in responses]
+    for frames in streams:
+        assert next(frames) == b': connected\n\n'
+    refreshed_by.clear()  # Requests catch up as they start
+    other.add_node('elsewhere', 'aces')
+    start = time.monotonic()
+    for frames in streams:
+        assert '"pubkey": "elsewhere"' in next(frames).decode()
+    assert time.monotonic() - start < 5
+    # The worker's one poller does the refreshing, not each stream
+    assert set(refreshed_by) == {'pok-store-poller'}
+    for response in responses:
+        response.close()
+
+def test_metrics_endpoint_and_profiler_toggle(client):
+    client.post('/node/add', json={'pubkey': 'metrics_pub', 'archetype': 'aces'})
+    client.post('/txn/create', json={'qid': 'q1', 'pubkey': 'metrics_pub', 'ans': 'A', 'type': 'completion'})
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'pok_engine_seconds_count{method="add_txns"}' in text
+    assert 'pok_http_requests_total{method="POST",route="/txn/create",status="201"}' in text
+    assert 'pok_mempool_txns{pubkey="metrics_pub"} 1' in text
+
+    assert client.post('/profile/start').status_code == 403
+    app.config['PROFILER_ENABLED'] = True
+    try:
+        assert client.post('/profile/start?interval=0.001').status_code == 200
+        assert client.post('/profile/start').status_code == 409
+        time.sleep(0.05)
+        stacks = client.post('/profile/stop').get_data(as_text=True)
+        assert all(line.rsplit(' ', 1)[1].isdigit() for line in stacks.splitlines())
+        assert client.post('/profile/stop').status_code == 409
+    finally:
+        app.config['PROFILER_ENABLED'] = False
+
+def test_profiler_samples_other_threads():
+    done = threading.Event()
+
+    def busy_worker():
+        while not done.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_worker)
+    worker.start()
+    profiler = SamplingProfiler()
+    try:
+        assert profiler.start(interval=0.001)
+        time.sleep(0.05)
+    finally:
+        stacks = profiler.stop()
+        done.set()
+        worker.join()
+    assert 'test_app.py:busy_worker' in stacks
+    assert 'app.py:_sample' not in stacks  # Not its own thread
+
 # B. Core Logic Unit Tests (Testing the POKEngine Class Directly)
 
 def test_calculate_convergence_mcq(engine, sample_node):
@@ -74,6 +212,35 @@ def test_propose_block_insufficient_quorum(engine, sample_node):
     assert len(sample_node.chain) == 0  # No block
     assert len(sample_node.mempool) == 2  # Unchanged
 
+def test_convergence_memoized_until_attestations_or_reputations_change(engine, sample_node, monkeypatch):
+    engine.add_node('pub1', 'diligent')
+    engine.add_node('pub2', 'diligent')
+    engine.add_txns(sample_node, [engine.create_txn('q1', 'pub1', 'A', 1.0, 'attestation'),
+                                  engine.create_txn('q1', 'pub2', 'B', 2.0, 'attestation'),
+                                  engine.create_txn('q1', 'late', 'B', 3.0, 'attestation')])
+    calls = []
+    log1p = math.log1p
+    monkeypatch.setattr(math, 'log1p', lambda x: calls.append(x) or log1p(x))
+    assert math.isclose(engine.calculate_convergence(sample_node, 'q1', weighted=True), 0.5, rel_tol=1e-9)
+    assert engine.calculate_convergence(sample_node, 'q1') == 0.5
+    engine.calculate_convergence(sample_node, 'q1', weighted=True)
+    assert len(calls) == 2  # Second weighted call was served from the cache
+
+    # A reputation change through the engine invalidates dependent questions
+    engine._update_reputation(sample_node, [engine.create_txn('q1', 'test_pubkey', 'A', 4.0, 'completion')])
+    assert engine.calculate_convergence(sample_node, 'q1', weighted=True) > 0.5
+    assert len(calls) > 2
+    before = engine.calculate_convergence(sample_node, 'q1', weighted=True)
+    engine.nodes['pub2'].reputation = 100.0  # As does a direct assignment
+    assert engine.calculate_convergence(sample_node, 'q1', weighted=True) != before
+
+    # So does a new attestation, and an unknown attester joining
+    engine.add_txns(sample_node, [engine.create_txn('q1', 'pub1', 'B', 5.0, 'attestation')])
+    assert math.isclose(engine.calculate_convergence(sample_node, 'q1'), 2 / 3, rel_tol=1e-9)
+    engine.add_node('late', 'diligent')
+    assert math.isclose(engine.calculate_convergence(sample_node, 'q1'), 3 / 4, rel_tol=1e-9)
+
+
 # C. Advanced Logic & Architectural Validation Tests
 
 def test_logarithmic_scaling_convergence(engine, sample_node):
@@ -116,6 +283,26 @@ def test_thought_leader_bonus(engine, sample_node):
     assert math.isclose(engine.nodes['early'].reputation, expected_early_rep, rel_tol=1e-9)
     assert math.isclose(engine.nodes['late'].reputation, expected_late_rep, rel_tol=1e-9)
 
+def test_thought_leader_bonus_against_early_dissent(engine, sample_node):
+    engine.add_node('dissent', 'guessers')
+    engine.add_node('leader', 'aces')
+    engine.add_node('follower', 'diligent')
+    now = time.time()
+    sample_node.mempool = [
+        engine.create_txn('q1', 'follower', 'A', now - 10, 'attestation'),
+        engine.create_txn('q1', 'dissent', 'B', now - 30, 'attestation'),
+        engine.create_txn('q1', 'leader', 'A', now - 20, 'attestation'),
+    ]
+    hist = sample_node.question_index.history['q1']
+    assert hist.timestamps == sorted(hist.timestamps)
+    mined_txn = engine.create_txn('q1', 'test_pubkey', 'A', now, 'completion')
+    assert engine._lookup_prop(hist, now - 20, mined_txn.payload.digest) == 0.0
+    assert math.isclose(engine._lookup_prop(hist, now - 10, mined_txn.payload.digest), 0.5, rel_tol=1e-9)
+    engine._update_reputation(sample_node, [mined_txn])
+    assert math.isclose(engine.nodes['leader'].reputation, 1.0 + engine.thought_leader_bonus * math.log1p(1.0), rel_tol=1e-9)
+    assert math.isclose(engine.nodes['follower'].reputation, 1.0 + math.log1p(1.0), rel_tol=1e-9)
+    assert engine.nodes['dissent'].reputation == 1.0
+
 def test_teacher_reveal_weight(engine, sample_node):
     # Setup: one standard attn 'A', one ap_reveal 'A' (weight 10)
     engine.add_node('pub1', 'diligent')
@@ -139,4 +326,503 @@ def test_onboarding_provisional_reputation(engine):
     engine.add_node('pub3', 'diligent')
     engine.nodes['pub3'].reputation = 15
     new_node = engine.add_node('new_pub', 'diligent')
-    assert math.isclose(new_node.reputation, 10, rel_tol=1e-9)
\ No newline at end of file
+    assert math.isclose(new_node.reputation, 10, rel_tol=1e-9)
+
+def test_question_index_tracks_mining_and_sync(engine, sample_node):
+    engine.add_node('pub1', 'diligent')
+    engine.add_node('pub2', 'diligent')
+    peer = engine.add_node('peer', 'aces')
+    completion = engine.create_txn('q1', 'test_pubkey', 'A', time.time(), 'completion')
+    attns = [engine.create_txn('q1', f'pub{i}', 'A', time.time() + i, 'attestation') for i in range(1, 3)]
+    engine.add_txns(sample_node, [completion] + attns)
+    engine.propose_pok_block(sample_node)
+    assert sample_node.question_index.attestation_counts['q1'] == 2
+    dissent = engine.create_txn('q1', 'pub1', 'B', time.time(), 'attestation')
+    engine.add_txns(peer, [dissent])
+    engine.sync_nodes(sample_node, peer)
+    # Peer adopted the mined chain and both mempools now hold the dissenting vote
+    for node in (sample_node, peer):
+        assert node.question_index.attestation_counts['q1'] == 3
+        assert math.isclose(engine.calculate_convergence(node, 'q1'), 2/3, rel_tol=1e-9)
+    sample_node.mempool = []
+    assert math.isclose(engine.calculate_convergence(sample_node, 'q1'), 1.0, rel_tol=1e-9)
+
+def test_sync_shares_chain_structure(engine, sample_node):
+    peer = engine.add_node('peer', 'aces')
+    attn = lambda qid, ans, t: [engine.create_txn(qid, 'peer', ans, t, 'attestation')]
+    base = Block.create(attn('q0', 'A', 1), 'attestation', '')
+    sample_node.chain = Chain().with_block(base)
+    peer.chain = sample_node.chain.with_block(Block.create(attn('q1', 'B', 2), 'attestation', base.hash))
+    peer.chain = peer.chain.with_block(Block.create(attn('q1', 'B', 3), 'attestation', peer.chain.tip_hash))
+    # sample_node forks off the shared base with its own block
+    sample_node.chain = sample_node.chain.with_block(Block.create(attn('q2', 'C', 4), 'attestation', base.hash))
+    assert sample_node.chain.common_ancestor(peer.chain).block is base
+    engine.sync_nodes(sample_node, peer)
+    assert sample_node.chain is peer.chain
+    assert len(sample_node.chain) == 3 and sample_node.chain[0] is base
+    assert [b.prev_hash for b in sample_node.chain][1:] == [b.hash for b in sample_node.chain][:-1]
+    assert sample_node.question_index.attestation_counts.get('q2', 0) == 0
+    assert sample_node.question_index.attestation_counts['q1'] == 2
+
+def test_chain_diff_finds_fork_by_hash():
+    blocks = []
+    for i in range(1000):
+        blocks.append(Block.create([], 'attestation', blocks[-1].hash if blocks else ''))
+    # Rebuilt separately: no shared cells, only matching hashes
+    local = Chain.from_blocks(blocks[:700])
+    remote = Chain.from_blocks(blocks)
+    fork = Chain.from_blocks(blocks[:400]).with_block(Block.create([], 'pok', blocks[399].hash))
+    assert local.diff(remote) == (700, blocks[700:])
+    assert remote.fork_height(fork) == 400
+    assert remote.at(123).tip_hash == blocks[122].hash
+    assert remote[-1] is blocks[-1]
+
+def test_block_hash_keeps_fields_apart():
+    def block(owner, qid):
+        return Block.create([Transaction(1, 1.0, owner, qid, 'attestation', answer_payload('A'))], 'attestation', '')
+    assert block('a|b', 'c').hash != block('a', 'b|c').hash
+
+def test_legacy_positional_block_hashes_are_rehashed(tmp_path):
+    def legacy_block(qid):
+        txn = {'id': f'1.0-pub1-attestation-{qid}', 'timestamp': 1.0, 'owner_pubkey': 'pub1', 'question_id': qid,
+               'type': 'attestation', 'payload': {'answer': 'A', 'hash': hashlib.sha256(b'A').hexdigest()}}
+        return {'hash': '0-att-block', 'txns': [txn], 'type': 'attestation'}
+
+    def legacy_node(pubkey, chain):
+        return {'pubkey': pubkey, 'archetype': 'aces', 'mempool': [], 'chain': chain,
+                'progress': 0, 'reputation': 1.0, 'consensus_history': {}}
+
+    state_file = tmp_path / 'app_state.json'
+    state_file.write_text(json.dumps({'nodes': {
+        'n1': legacy_node('n1', [legacy_block('qA')]),
+        'n2': legacy_node('n2', [legacy_block('qB'), dict(legacy_block('qC'), hash='1-att-block')]),
+    }}))
+    engine = POKEngine('pok_curriculum_trimmed.json', state_file=str(state_file))
+    n1, n2 = engine.nodes['n1'], engine.nodes['n2']
+    assert n1.chain.tip_hash != n2.chain.parent.tip_hash
+    n1.question_index  # Indexed before the sync, so adoption goes through the fork diff
+    engine.sync_nodes(n1, n2)
+    assert [t.question_id for b in n1.chain for t in b.txns] == ['qB', 'qC']
+    counts = n1.question_index.attestation_counts
+    assert (counts.get('qA', 0), counts.get('qB'), counts.get('qC')) == (0, 1, 1)
+
+def test_sync_reconciles_only_differing_buckets(engine, sample_node):
+    peer = engine.add_node('peer', 'aces')
+    shared = [engine.create_txn(f'q{i}', 'peer', 'A', i, 'attestation') for i in range(5)]
+    sample_node.mempool = list(shared)
+    peer.mempool = list(shared)
+    assert sample_node.mempool.missing_from(peer.mempool) == []
+    extra = engine.create_txn('q3', 'test_pubkey', 'B', 10, 'completion')
+    engine.add_txns(peer, [extra])
+    assert [qid for qid in peer.mempool.bucket_digests
+            if peer.mempool.bucket_digests[qid] != sample_node.mempool.bucket_digests.get(qid)] == ['q3']
+    engine.sync_nodes(sample_node, peer)
+    assert extra.id in sample_node.mempool
+    assert sample_node.mempool.digest == peer.mempool.digest
+    # Re-adding a known id is a no-op and removal is by id
+    sample_node.mempool.append(extra)
+    assert len(sample_node.mempool) == 6
+    sample_node.mempool.discard_ids([extra.id])
+    assert extra.id not in sample_node.mempool
+
+def test_compact_transaction_representation(engine):
+    txn = engine.create_txn(''.join(['q', '1']), 'test_pubkey', 'A', 1.0, 'attestation')
+    other = engine.create_txn(''.join(['q', '1']), 'pub1', 'A', 2.0, 'attestation')
+    assert not hasattr(txn, '__dict__')
+    assert txn.question_id is other.question_id  # interned
+    assert txn.payload is other.payload  # shared for equal short answers
+    assert len(txn.payload.digest) == 32
+    assert txn.payload.hash == txn.payload.digest.hex()
+
+def test_create_txns_matches_create_txn_and_caches_short_answers(engine):
+    specs = [('q1', 'pub1', 'A', 1.0, 'completion'), ('q2', 'pub2', 'x' * 500, 2.0, 'completion')]
+    bulk = engine.create_txns(specs)
+    single = [engine.create_txn(*spec) for spec in specs]
+    fields = lambda t: (t.timestamp, t.owner_pubkey, t.question_id, t.type, t.payload)
+    assert [fields(t) for t in bulk] == [fields(t) for t in single]
+    assert answer_payload('A') is bulk[0].payload
+    assert answer_payload('x' * 500) is not bulk[1].payload  # Long answers skip the cache
+    assert bulk[1].payload.hash == hashlib.sha256(('x' * 500).encode()).hexdigest()
+
+def test_txn_ids_unique_within_one_tick(engine, sample_node):
+    engine.add_node('pub1', 'diligent')
+    t = time.time()
+    burst = engine.create_txns([('q1', 'pub1', 'A', t, 'attestation')] * 50)
+    assert len({txn.id for txn in burst}) == 50
+    assert all(isinstance(txn.id, int) and txn.id < 2 ** 64 for txn in burst)
+    engine.add_txns(engine.nodes['pub1'], burst)
+    engine.sync_nodes(sample_node, engine.nodes['pub1'])
+    assert len(sample_node.mempool) == 50
+
+def test_curriculum_index_and_answer_digests(engine):
+    curriculum = engine.curriculum
+    assert curriculum._questions == [None, None]  # Nothing built until read
+    q = curriculum.get('U9-PC-MCQ-B-Q05')
+    assert q is curriculum[1] and q.qtype == 'mcq' and q.answer_key == 'C'
+    assert curriculum._questions[0] is None
+    assert curriculum.answer_digest(q.id) == hashlib.sha256(b'C').digest()
+    assert curriculum.answer_digest('U1-L10-Q04') is None  # Free response
+    assert curriculum.get('missing') is None and 'missing' not in curriculum
+
+def test_state_pages_chain_and_mempool_by_cursor(engine, sample_node):
+    chain = Chain()
+    for i in range(5):
+        txns = [engine.create_txn(f'q{i}', 'test_pubkey', 'A', i, 'attestation')]
+        chain = chain.with_block(Block.create(txns, 'attestation', chain.tip_hash))
+    sample_node.chain = chain
+    engine.add_txns(sample_node, [engine.create_txn(f'q{i}', 'test_pubkey', 'A', i, 'completion') for i in range(3)])
+    blocks, txns, cursors = [], [], {}
+    while True:
+        state = node_state(sample_node, ('chain', 'mempool'), 2, cursors.get('chain'), cursors.get('mempool'))
+        blocks += [b['hash'] for b in state['chain']]
+        txns += [t['id'] for t in state['mempool']]
+        cursors = {name: page['cursor'] for name, page in state['page'].items()}
+        if not any(page['more'] for page in state['page'].values()):
+            break
+    assert blocks == [b.hash for b in chain]
+    assert txns == [txn_id_to_str(t.id) for t in sample_node.mempool]
+    # Paging skips removed transactions and survives the index compacting
+    pool = sample_node.mempool
+    more = engine.create_txns([(f'q{i}', 'test_pubkey', 'A', i, 'completion') for i in range(200)])
+    pool.extend(more)
+    pool.discard_ids([t.id for t in more[:150]])
+    assert pool.page(more[160].id, 3) == more[161:164]
+    assert pool.page(None, 5) == list(pool)[:5]
+    # Once the node adopts another chain the old cursor is rejected
+    sample_node.chain = Chain().with_block(Block.create([], 'attestation', ''))
+    with pytest.raises(StaleCursor):
+        node_state(sample_node, ('chain',), 2, cursors['chain'])
+
+def test_change_feed_resumes_from_token(engine, sample_node):
+    engine.add_node('pub1', 'diligent')
+    engine.add_node('pub2', 'diligent')
+    start = engine.changes.last_seq
+    completion = engine.create_txn('q1', 'test_pubkey', 'A', time.time(), 'completion')
+    attns = [engine.create_txn('q1', f'pub{i}', 'A', time.time(), 'attestation') for i in (1, 2)]
+    engine.add_txns(sample_node, [completion] + attns)
+    engine.propose_pok_block(sample_node)
+    frames, token = engine.changes.changes_after(start)
+    ops = [json.loads(f.decode().split('data: ')[1])['op'] for f in frames]
+    assert ops == ['txns', 'block', 'reputation'] and token == engine.journal_seq
+    reputation = json.loads(frames[-1].decode().split('data: ')[1])['reputations']['pub1']
+    assert math.isclose(reputation['delta'], engine.nodes['pub1'].reputation - 1.0, rel_tol=1e-9)
+    assert len(engine.changes.changes_after(start, pubkey='pub2')[0]) == 1
+    assert engine.changes.changes_after(token)[0] == []
+    engine.changes.reset(token, engine.nodes)  # e.g. reloaded after a compaction
+    assert engine.changes.changes_after(start) == (None, token)
+
+def test_mining_scheduler_coalesces_and_rate_limits(engine, sample_node):
+    def wait_until(predicate):
+        deadline = time.time() + 5
+        while not predicate() and time.time() < deadline:
+            time.sleep(0.01)
+        assert predicate()
+
+    scheduler = MiningScheduler(engine, workers=2, min_interval=0.3)
+    scheduler.start()
+    try:
+        attestations = lambda start: [
+            engine.create_txn(f'q{i}', 'test_pubkey', 'A', time.time(), 'attestation') for i in range(start, start + 5)
+        ]
+        engine.add_txns(sample_node, attestations(0))
+        wait_until(lambda: scheduler.status('test_pubkey')['state'] == 'idle' and scheduler.runs == 1)
+        assert scheduler.status('test_pubkey')['last_run']['blocks'] == 1
+
+        # Five separate additions inside the rate limit coalesce into one run
+        for txn in attestations(5):
+            engine.add_txns(sample_node, [txn])
+        status = scheduler.status('test_pubkey')
+        assert status['state'] == 'queued' and status['due_in'] > 0.1
+        wait_until(lambda: len(sample_node.chain) == 2)
+        time.sleep(0.05)
+        assert scheduler.status() == {'workers': 2, 'queued': 0, 'mining': 0, 'runs': 2}
+    finally:
+        scheduler.stop()
+    assert engine.activity_listeners == []
+
+# D. Persistence Tests
+
+def test_submit_txns_persists_batch_once(engine, sample_node, monkeypatch):
+    engine.add_node('pub1', 'diligent')
+    appends = []
+    original = engine._append_journal
+    monkeypatch.setattr(engine, '_append_journal', lambda *events: appends.append(events) or original(*events))
+    results = engine.submit_txns([
+        {'qid': f'q{i}', 'pubkey': pubkey, 'ans': 'A', 'type': 'attestation'}
+        for i in range(3) for pubkey in ('test_pubkey', 'pub1')
+    ])
+    assert all(r['status'] == 'success' for r in results)
+    assert len(appends) == 1 and len(appends[0]) == 2
+    reloaded = POKEngine('pok_curriculum_trimmed.json', state_file=engine.state_file)
+    assert len(reloaded.nodes['test_pubkey'].mempool) == 3
+    assert len(reloaded.nodes['pub1'].mempool) == 3
+
+def test_sqlite_store_shares_state_between_engines(tmp_path):
+    # Two engines on one database stand in for two worker processes
+    db = str(tmp_path / 'app_state.db')
+    worker1 = POKEngine('pok_curriculum_trimmed.json', store=SQLiteStateStore(db, keep_events=2))
+    worker2 = POKEngine('pok_curriculum_trimmed.json', store=SQLiteStateStore(db, keep_events=2))
+    for pubkey in ('test_pubkey', 'pub1', 'pub2'):
+        worker1.add_node(pubkey, 'diligent')
+    worker2.refresh()
+    assert set(worker2.nodes) == {'test_pubkey', 'pub1', 'pub2'}
+    worker2.submit_txns([{'qid': 'q1', 'pubkey': 'test_pubkey', 'ans': 'A', 'type': 'completion'}] + [
+        {'qid': 'q1', 'pubkey': f'pub{i}', 'ans': 'A', 'type': 'attestation'} for i in (1, 2)])
+    # worker1 catches up inside its write transaction before mining
+    for pubkey in ('pub1', 'pub2'):
+        worker1.sync_nodes(worker1.nodes['test_pubkey'], worker1.nodes[pubkey])
+    worker1.propose_pok_block(worker1.nodes['test_pubkey'])
+    assert len(worker1.nodes['test_pubkey'].chain) == 1
+    worker1.save_state_to_disk()
+    for i in range(3):
+        worker1.add_txns(worker1.nodes['pub1'], [worker1.create_txn(f'q{i}', 'pub1', 'B', i, 'completion')])
+    # worker2 is now behind the compacted journal and reloads from the snapshot
+    worker2.refresh()
+    assert worker2.journal_seq == worker1.journal_seq
+    assert worker2.nodes['test_pubkey'].chain.tip_hash == worker1.nodes['test_pubkey'].chain.tip_hash
+    assert math.isclose(worker2.nodes['pub1'].reputation, worker1.nodes['pub1'].reputation, rel_tol=1e-9)
+    assert [t.id for t in worker2.nodes['pub1'].mempool] == [t.id for t in worker1.nodes['pub1'].mempool]
+
+def test_journal_replay_restores_state(engine, sample_node):
+    engine.add_node('pub1', 'diligent')
+    engine.add_node('pub2', 'diligent')
+    completion = engine.create_txn('q1', 'test_pubkey', 'A', time.time(), 'completion')
+    attns = [engine.create_txn('q1', f'pub{i}', 'A', time.time(), 'attestation') for i in range(1, 3)]
+    engine.add_txns(sample_node, [completion] + attns)
+    engine.propose_pok_block(sample_node)
+    reloaded = POKEngine('pok_curriculum_trimmed.json', state_file=engine.state_file)
+    node = reloaded.nodes['test_pubkey']
+    assert len(node.chain) == 1
+    assert node.chain[0].txns[0].payload.hash == completion.payload.hash
+    assert len(node.mempool) == 0
+    assert math.isclose(reloaded.nodes['pub1'].reputation, engine.nodes['pub1'].reputation, rel_tol=1e-9)
+
+def test_torn_journal_append_is_cut_off_on_restart(tmp_path):
+    state_file = str(tmp_path / 'app_state.json')
+    engine = POKEngine('pok_curriculum_trimmed.json', state_file=state_file)
+    engine.add_node('a', 'aces')
+    engine.add_node('b', 'aces')
+    with open(engine.store.journal_file, 'a') as f:
+        f.write('{"op": "add_node", "pubkey": "tor')  # Crash mid-append
+    restarted = POKEngine('pok_curriculum_trimmed.json', state_file=state_file)
+    assert set(restarted.nodes) == {'a', 'b'} and restarted.journal_seq == 2
+    node = restarted.add_node('c', 'aces')
+    restarted.add_txns(node, [restarted.create_txn('q1', 'c', 'A', time.time(), 'completion')])
+    again = POKEngine('pok_curriculum_trimmed.json', state_file=state_file)
+    assert set(again.nodes) == {'a', 'b', 'c'} and again.journal_seq == 4
+    assert len(again.nodes['c'].mempool) == 1
+
+def test_snapshot_compacts_journal(engine, sample_node):
+    engine.snapshot_interval = 3
+    for i in range(4):
+        engine.add_txns(sample_node, [engine.create_txn(f'q{i}', 'test_pubkey', 'A', i, 'completion')])
+    reloaded = POKEngine('pok_curriculum_trimmed.json', state_file=engine.state_file)
+    assert [t.question_id for t in reloaded.nodes['test_pubkey'].mempool] == ['q0', 'q1', 'q2', 'q3']
+    assert reloaded.journal_seq == engine.journal_seq
+
+def test_memory_store_disables_persistence(tmp_path):
+    state_file = tmp_path / 'app_state.json'
+    engine = POKEngine('pok_curriculum_trimmed.json', state_file=str(state_file),
+                       store=MemoryStateStore(), quorum_conv_thresh=0.9)
+    node = engine.add_node('test_pubkey', 'aces')
+    engine.add_txns(node, [engine.create_txn('q1', 'test_pubkey', 'A', time.time(), 'completion')])
+    engine.save_state_to_disk()
+    assert engine.quorum_conv_thresh == 0.9
+    assert list(tmp_path.iterdir()) == []
+    reloaded = POKEngine('pok_curriculum_trimmed.json', state_file=str(state_file), store=MemoryStateStore())
+    assert reloaded.nodes == {}
+
+def test_failed_journal_append_leaves_no_txns_behind(engine, sample_node, monkeypatch):
+    seq = engine.journal_seq
+    append = engine.store.append_events
+
+    def disk_full(events):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(engine.store, 'append_events', disk_full)
+    with pytest.raises(OSError):
+        engine.add_txns(sample_node, [engine.create_txn('q1', 'test_pubkey', 'A', 1.0, 'completion')])
+    with pytest.raises(OSError):
+        engine.submit_txns([{'qid': 'q2', 'pubkey': 'test_pubkey', 'ans': 'B', 'type': 'completion'}])
+    assert list(sample_node.mempool) == [] and engine.journal_seq == seq
+    assert 'q1' not in sample_node.question_index.txns and 'q2' not in sample_node.question_index.txns
+
+    monkeypatch.setattr(engine.store, 'append_events', append)
+    engine.add_txns(sample_node, [engine.create_txn('q1', 'test_pubkey', 'A', 1.0, 'completion')])
+    reloaded = POKEngine('pok_curriculum_trimmed.json', state_file=engine.state_file)
+    assert [t.question_id for t in reloaded.nodes['test_pubkey'].mempool] == ['q1']
+
+    # An append the disk takes but cannot sync is cut back off the journal
+    size = os.path.getsize(engine.store.journal_file)
+    monkeypatch.setattr(os, 'fsync', disk_full)
+    with pytest.raises(OSError):
+        engine.add_txns(sample_node, [engine.create_txn('q3', 'test_pubkey', 'C', 2.0, 'completion')])
+    assert os.path.getsize(engine.store.journal_file) == size
+    assert [t.question_id for t in sample_node.mempool] == ['q1']
+
+def test_buffered_and_checkpoint_persistence(tmp_path):
+    def reload(name):
+        return POKEngine('pok_curriculum_trimmed.json', state_file=str(tmp_path / name)).nodes
+
+    debounced = POKEngine('pok_curriculum_trimmed.json', state_file=str(tmp_path / 'debounced.json'),
+                          persistence='debounced', flush_delay=60)
+    debounced.add_node('pub1', 'aces')
+    assert reload('debounced.json') == {}
+    debounced.flush()
+    assert 'pub1' in reload('debounced.json')
+    debounced.add_node('pub2', 'aces')
+    debounced.close()
+    assert 'pub2' in reload('debounced.json')
+
+    interval = POKEngine('pok_curriculum_trimmed.json', state_file=str(tmp_path / 'interval.json'),
+                         persistence='interval', flush_interval=0.05)
+    interval.add_node('pub1', 'aces')
+    deadline = time.time() + 5
+    while 'pub1' not in reload('interval.json') and time.time() < deadline:
+        time.sleep(0.02)
+    assert 'pub1' in reload('interval.json')
+    interval.close()
+
+    checkpointed = POKEngine('pok_curriculum_trimmed.json', state_file=str(tmp_path / 'checkpoint.json'),
+                             persistence='checkpoint')
+    checkpointed.snapshot_interval = 1
+    checkpointed.add_node('pub1', 'aces')
+    checkpointed.add_node('pub2', 'aces')
+    assert reload('checkpoint.json') == {}
+    checkpointed.checkpoint()
+    assert set(reload('checkpoint.json')) == {'pub1', 'pub2'}
+    # Later checkpoints write only the changed nodes and keep the rest
+    checkpointed.add_txns(checkpointed.nodes['pub2'], [checkpointed.create_txn('q1', 'pub2', 'A', 1.0, 'completion')])
+    checkpointed.checkpoint()
+    nodes = reload('checkpoint.json')
+    assert set(nodes) == {'pub1', 'pub2'} and len(nodes['pub2'].mempool) == 1
+
+    with pytest.raises(ValueError):
+        POKEngine('pok_curriculum_trimmed.json', store=SQLiteStateStore(str(tmp_path / 'db')), persistence='interval')
+
+def test_partial_snapshot_rewrites_only_changed_nodes(engine, sample_node, tmp_path):
+    for pubkey in ('pub1', 'pub2', 'bystander'):
+        engine.add_node(pubkey, 'diligent')
+    engine.save_state_to_disk()
+    manifest_path = tmp_path / 'app_state.state' / 'MANIFEST'
+    before = json.loads(read_checked(manifest_path))
+    engine.add_txns(sample_node, [engine.create_txn('q1', 'test_pubkey', 'A', time.time(), 'completion')] + [
+        engine.create_txn('q1', f'pub{i}', 'A', time.time(), 'attestation') for i in (1, 2)])
+    engine.propose_pok_block(sample_node)
+    assert len(sample_node.chain) == 1
+    engine.save_state_to_disk()
+    after = json.loads(read_checked(manifest_path))
+    changed = {pubkey for pubkey in after['nodes'] if after['nodes'][pubkey] != before['nodes'][pubkey]}
+    assert 'test_pubkey' in changed and 'bystander' not in changed
+    assert after['blocks'] == before['blocks'] and after['blocks_size'] > before['blocks_size']
+    # Only files of the current and previous snapshot are kept
+    kept = {'MANIFEST', 'MANIFEST.prev', after['blocks'], *after['nodes'].values(), *before['nodes'].values()}
+    assert set(os.listdir(tmp_path / 'app_state.state')) == kept
+
+    for store in (None, SQLiteStateStore(str(tmp_path / 'app_state.db'))):
+        if store is not None:
+            # Nodes have every field a snapshot view has
+            store.write_snapshot(engine.journal_seq, list(engine.nodes.values()))
+            store.write_snapshot(engine.journal_seq, [sample_node], partial=True)
+        reloaded = POKEngine('pok_curriculum_trimmed.json', state_file=engine.state_file, store=store)
+        for pubkey, node in engine.nodes.items():
+            copy = reloaded.nodes[pubkey]
+            assert copy.chain.tip_hash == node.chain.tip_hash and len(copy.chain) == len(node.chain)
+            assert [t.id for t in copy.mempool] == [t.id for t in node.mempool]
+            assert math.isclose(copy.reputation, node.reputation, rel_tol=1e-9)
+
+def test_damaged_snapshot_falls_back_to_previous(engine, sample_node, tmp_path):
+    engine.add_node('pub1', 'diligent')
+    engine.save_state_to_disk()
+    engine.add_txns(sample_node, [engine.create_txn('q1', 'test_pubkey', 'A', time.time(), 'completion')])
+    engine.save_state_to_disk()
+    engine.add_txns(sample_node, [engine.create_txn('q2', 'test_pubkey', 'B', time.time(), 'completion')])
+    state_dir = tmp_path / 'app_state.state'
+    manifest = json.loads(read_checked(state_dir / 'MANIFEST'))
+    node_file = state_dir / manifest['nodes']['test_pubkey']
+    node_file.write_bytes(node_file.read_bytes()[:-5])  # Torn by a crash
+    reloaded = POKEngine('pok_curriculum_trimmed.json', state_file=engine.state_file)
+    # The previous snapshot plus the journal kept since it restore everything
+    assert [t.question_id for t in reloaded.nodes['test_pubkey'].mempool] == ['q1', 'q2']
+    assert reloaded.journal_seq == engine.journal_seq
+    assert not node_file.exists()
+    reloaded.save_state_to_disk()
+
+    (state_dir / 'MANIFEST').write_bytes(b'\0' * 16)
+    (state_dir / 'MANIFEST.prev').write_bytes(b'')
+    with pytest.raises(ValueError):
+        POKEngine('pok_curriculum_trimmed.json', state_file=engine.state_file)
+
+def test_crash_between_manifest_renames_keeps_the_snapshot(engine, sample_node, tmp_path, monkeypatch):
+    engine.add_node('a', 'diligent')
+    engine.save_state_to_disk()
+    engine.add_txns(sample_node, [engine.create_txn('q1', 'test_pubkey', 'A', time.time(), 'completion')])
+    replace = os.replace
+
+    def crash_before_commit(src, dst):
+        if str(src).endswith('MANIFEST.tmp'):
+            raise OSError("crashed")
+        replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', crash_before_commit)
+    with pytest.raises(OSError):
+        engine.save_state_to_disk()
+    monkeypatch.setattr(os, 'replace', replace)
+    state_dir = tmp_path / 'app_state.state'
+    assert not (state_dir / 'MANIFEST').exists() and (state_dir / 'MANIFEST.prev').exists()
+
+    for _ in range(2):
+        reloaded = POKEngine('pok_curriculum_trimmed.json', state_file=engine.state_file)
+        assert 'a' in reloaded.nodes
+        assert [t.question_id for t in reloaded.nodes['test_pubkey'].mempool] == ['q1']
+    reloaded.add_node('b', 'diligent')
+    reloaded.save_state_to_disk()
+    assert set(POKEngine('pok_curriculum_trimmed.json', state_file=engine.state_file).nodes) == {'test_pubkey', 'a', 'b'}
+
+def test_binary_snapshot_decodes_chains_lazily(engine, sample_node, monkeypatch):
+    peer = engine.add_node('peer', 'aces')
+    chain = Chain()
+    for i in range(3):
+        txns = [engine.create_txn(f'q{i}', 'peer', 'A', i, 'attestation')]
+        chain = chain.with_block(Block.create(txns, 'attestation', chain.tip_hash))
+    sample_node.chain = chain
+    peer.chain = chain.parent  # Shares its first two blocks with sample_node
+    engine.save_state_to_disk()
+    decoded = []
+    monkeypatch.setattr('app.block_from_dict', lambda data: decoded.append(data['hash']) or block_from_dict(data))
+    reloaded = POKEngine('pok_curriculum_trimmed.json', state_file=engine.state_file)
+    node, copy = reloaded.nodes['test_pubkey'], reloaded.nodes['peer']
+    assert len(node.chain) == 3 and len(copy.chain) == 2
+    assert decoded == []
+    assert [b.hash for b in node.chain] == [b.hash for b in chain]
+    assert copy.chain.tip_hash == chain.parent.tip_hash
+    # Each block was decoded once and the shared prefix is shared again
+    assert len(decoded) == 3 and node.chain.parent.block is copy.chain.block
+    assert node.question_index.attestation_counts['q2'] == 1
+
+def test_concurrent_mutations_stay_consistent(engine):
+    engine.snapshot_interval = 25
+    pubkeys = [f'node{i}' for i in range(6)]
+    for pubkey in pubkeys:
+        engine.add_node(pubkey, 'diligent')
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for i in range(40):
+            pubkey = rng.choice(pubkeys)
+            engine.submit_txns([{'qid': f'q{i % 4}', 'pubkey': pubkey, 'ans': rng.choice('AB'), 'type': 'attestation'}])
+            a, b = rng.sample(pubkeys, 2)
+            engine.sync_nodes(engine.nodes[a], engine.nodes[b])
+            engine.propose_attestation_block(engine.nodes[pubkey])
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    reloaded = POKEngine('pok_curriculum_trimmed.json', state_file=engine.state_file)
+    for pubkey in pubkeys:
+        node, copy = engine.nodes[pubkey], reloaded.nodes[pubkey]
+        assert [t.id for t in copy.mempool] == [t.id for t in node.mempool]
+        assert copy.chain.tip_hash == node.chain.tip_hash
@@ -1,10 +1,13 @@
 # verify_sim.py (v1.1 - Final Verified Version)
 
+import os
 import time
 import random
 import statistics
 from collections import Counter
 
+# Keep importing app from touching backend/data
+os.environ.setdefault('POK_PERSISTENCE', 'none')
 # CRITICAL: Import the verified classes directly from our canonical app.py
 from app import POKEngine, Node, Question, Transaction
 
@@ -21,6 +24,14 @@ ARCHETYPES = {
     'strugglers': 0.60,
     'guessers': 0.25
 }
+# Share of each archetype in a class (4/24/8/4 of the canonical 40 nodes)
+ARCHETYPE_MIX = {'aces': 0.1, 'diligent': 0.6, 'strugglers': 0.2, 'guessers': 0.1}
+
+def archetype_distribution(total_nodes: int) -> list:
+    """Archetypes for total_nodes in ARCHETYPE_MIX proportions (unshuffled)."""
+    counts = {name: int(share * total_nodes) for name, share in ARCHETYPE_MIX.items()}
+    counts['diligent'] += total_nodes - sum(counts.values())
+    return [name for name in ARCHETYPE_MIX for _ in range(counts[name])]
 
 # --- Metric Calculation Functions ---
 
@@ -31,15 +42,15 @@ def calculate_truth_accuracy(engine: POKEngine) -> float:
     all_mined_completions = [txn for node in engine.nodes.values() for block in node.chain if block.type == 'pok' for txn in block.txns if txn.type == 'completion']
 
     for txn in all_mined_completions:
-        question = next((q for q in engine.curriculum if q.id == txn.question_id), None)
-        if question and question.qtype == 'mcq' and question.answer_key:
+        key_digest = engine.curriculum.answer_digest(txn.question_id)
+        if key_digest is not None:
             total_mined_mcqs += 1
-            if txn.payload.answer == question.answer_key:
+            if txn.payload.digest == key_digest:
                 correct_mcqs += 1
                 
     return (correct_mcqs / total_mined_mcqs) * 100 if total_mined_mcqs > 0 else 100.0
 
-def calculate_block_latency(engine: POKEngine) -> float:
+def calculate_block_latency(engine: POKEngine, creation_days: dict, mined_days: dict) -> float:
     latencies = []
     # Find all completion transactions that have been mined
     all_mined_completions = [
@@ -53,8 +64,8 @@ def calculate_block_latency(engine: POKEngine) -> float:
 
     for txn in all_mined_completions:
         # Check if the transaction has our simulation metadata
-        if hasattr(txn, 'creation_day') and hasattr(txn, 'mined_day'):
-            latency = txn.mined_day - txn.creation_day
+        if txn.id in creation_days and txn.id in mined_days:
+            latency = mined_days[txn.id] - creation_days[txn.id]
             if latency >= 0:
                 latencies.append(latency)
 
@@ -73,59 +84,72 @@ def calculate_chain_fragmentation(engine: POKEngine) -> float:
     if max_len == 0: return 0.0
     
     fragmented_nodes = sum(1 for length in chain_lengths if length < max_len)
-    return (fragmented_nodes / TOTAL_NODES) * 100
+    return (fragmented_nodes / len(chain_lengths)) * 100
 
 # --- Main Simulation Logic ---
 
-def run_simulation():
-    print("--- Starting APStat Chain E2E Verification Simulation ---")
-    
-    engine = POKEngine('pok_curriculum_trimmed.json')
+def run_simulation(sim_days=SIM_DAYS, total_nodes=TOTAL_NODES, seed=None, verbose=True, write_report=True,
+                   persistence='none', **engine_params):
+    """Runs the canonical simulation; returns its accuracy, latency and fragmentation.
+
+    A seed makes the run reproducible. The engine runs in memory by default,
+    so runs never see each other's state; persistence and engine_params
+    (e.g. quorum_conv_thresh) are passed on to POKEngine.
+    """
+    rng = random.Random(seed)
+    log = print if verbose else (lambda *args, **kwargs: None)
+    log("--- Starting APStat Chain E2E Verification Simulation ---")
+
+    engine = POKEngine('pok_curriculum_trimmed.json', persistence=persistence, **engine_params)
     if not engine.curriculum:
         print("FATAL: Could not load curriculum. Make sure 'pok_curriculum_trimmed.json' exists.")
         return
 
     # 1. Setup Nodes
-    classes = {'a': [], 'b': []}
-    archetype_distribution = (['aces'] * 4 + ['diligent'] * 24 + ['strugglers'] * 8 + ['guessers'] * 4)
-    random.shuffle(archetype_distribution)
+    archetypes = archetype_distribution(total_nodes)
+    rng.shuffle(archetypes)
     
-    for i in range(TOTAL_NODES):
-        class_key = 'a' if i < CLASS_SIZE else 'b'
-        pubkey = f'pub_{class_key}_{i % CLASS_SIZE}'
-        engine.add_node(pubkey, archetype_distribution[i])
-        classes[class_key].append(pubkey)
+    for i in range(total_nodes):
+        pubkey = f'pub_{i // CLASS_SIZE}_{i % CLASS_SIZE}'
+        engine.add_node(pubkey, archetypes[i])
 
-    print(f"Initialized {TOTAL_NODES} nodes across 2 classrooms.")
+    log(f"Initialized {total_nodes} nodes across {-(-total_nodes // CLASS_SIZE)} classrooms.")
 
     # --- Simulation Loop ---
     daily_fragmentation_log = []
+    # Simulation metadata, keyed by txn id (transactions are slotted)
+    creation_days = {}
+    mined_days = {}
 
-    for day in range(1, SIM_DAYS + 1):
-        print(f"\n--- Day {day}/{SIM_DAYS} ---")
+    for day in range(1, sim_days + 1):
+        log(f"\n--- Day {day}/{sim_days} ---")
         
         # PHASE 1: SOLO WORK
         for node in engine.nodes.values():
+            specs = []
             for _ in range(QUESTIONS_PER_DAY):
                 q_index = node.progress % len(engine.curriculum)
                 q = engine.curriculum[q_index]
                 
-                is_correct = random.random() < ARCHETYPES.get(node.archetype, 0.5)
+                is_correct = rng.random() < ARCHETYPES.get(node.archetype, 0.5)
                 ans = q.answer_key if is_correct and q.answer_key else 'B'
                 
-                txn = engine.create_txn(q.id, node.pubkey, ans, time.time(), 'completion')
-                setattr(txn, 'creation_day', day) # Attach simulation metadata
-                node.mempool.append(txn)
+                specs.append((q.id, node.pubkey, ans, time.time(), 'completion'))
                 node.progress += 1
+
+            txns = engine.create_txns(specs)
+            for txn in txns:
+                creation_days[txn.id] = day # Attach simulation metadata
+            node.mempool.extend(txns)
         
-        print(f"Solo work complete. Avg progress: {statistics.mean([n.progress for n in engine.nodes.values()]):.1f} questions.")
+        log(f"Solo work complete. Avg progress: {statistics.mean([n.progress for n in engine.nodes.values()]):.1f} questions.")
 
         # PHASE 2: MEETING & SYNC
         if (day - 1) % 5 < MEETINGS_PER_WEEK:
-            print("Meeting Day: Running sync, attestation, and mining...")
+            log("Meeting Day: Running sync, attestation, and mining...")
             
             all_pubkeys = list(engine.nodes.keys())
-            random.shuffle(all_pubkeys)
+            rng.shuffle(all_pubkeys)
             
             for i in range(0, len(all_pubkeys) - 1, 2):
                 node1 = engine.nodes[all_pubkeys[i]]
@@ -135,13 +159,13 @@ def run_simulation():
                 for node, partner in [(node1, node2), (node2, node1)]:
                     partner_completions = [t for t in partner.mempool if t.type == 'completion']
                     if partner_completions:
-                        num_to_attest = random.randint(1, min(3, len(partner_completions)))
-                        txns_to_attest = random.sample(partner_completions, num_to_attest)
+                        num_to_attest = rng.randint(1, min(3, len(partner_completions)))
+                        txns_to_attest = rng.sample(partner_completions, num_to_attest)
                         
                         for txn_to_attest in txns_to_attest:
-                            q = next((q for q in engine.curriculum if q.id == txn_to_attest.question_id), None)
+                            q = engine.curriculum.get(txn_to_attest.question_id)
                             if q:
-                                is_correct = random.random() < ARCHETYPES.get(node.archetype, 0.5)
+                                is_correct = rng.random() < ARCHETYPES.get(node.archetype, 0.5)
                                 ans = q.answer_key if is_correct and q.answer_key else 'B'
                                 attestation_txn = engine.create_txn(q.id, node.pubkey, ans, time.time(), 'attestation')
                                 node.mempool.append(attestation_txn)
@@ -156,30 +180,31 @@ def run_simulation():
                         new_block = node.chain[block_index]
                         if new_block.type == 'pok':
                             for txn in new_block.txns:
-                                if txn.type == 'completion' and not hasattr(txn, 'mined_day'):
-                                    setattr(txn, 'mined_day', day)
+                                if txn.type == 'completion' and txn.id not in mined_days:
+                                    mined_days[txn.id] = day
 
         # PHASE 3: END OF DAY LOGGING
         daily_fragmentation_log.append(calculate_chain_fragmentation(engine))
-        print(f"End of Day {day}. Fragmentation: {daily_fragmentation_log[-1]:.1f}%")
+        log(f"End of Day {day}. Fragmentation: {daily_fragmentation_log[-1]:.1f}%")
 
     # --- Final Report Generation ---
-    print("\n--- Simulation Complete. Generating Final Report... ---")
+    log("\n--- Simulation Complete. Generating Final Report... ---")
     
     final_accuracy = calculate_truth_accuracy(engine)
-    final_latency = calculate_block_latency(engine)
+    final_latency = calculate_block_latency(engine, creation_days, mined_days)
     final_fragmentation = statistics.mean(daily_fragmentation_log) if daily_fragmentation_log else 0.0
 
-    with open('simulation_results_python.md', 'w') as f:
-        f.write("# Python E2E Simulation Results\n\n")
-        f.write("This report was generated by the canonical `verify_sim.py` using the verified `app.py` engine.\n\n")
-        f.write(f"- **Truth Accuracy:** {final_accuracy:.1f}%\n")
-        f.write(f"- **Block Latency:** {final_latency:.1f} days\n")
-        f.write(f"- **Average Chain Fragmentation:** {final_fragmentation:.1f}%\n")
-
-    print("Report 'simulation_results_python.md' generated successfully.")
-    print(f"Final Metrics:\n  Accuracy: {final_accuracy:.1f}%\n  Latency: {final_latency:.1f} days\n  Fragmentation: {final_fragmentation:.1f}%")
-
+    if write_report:
+        with open('simulation_results_python.md', 'w') as f:
+            f.write("# Python E2E Simulation Results\n\n")
+            f.write("This report was generated by the canonical `verify_sim.py` using the verified `app.py` engine.\n\n")
+            f.write(f"- **Truth Accuracy:** {final_accuracy:.1f}%\n")
+            f.write(f"- **Block Latency:** {final_latency:.1f} days\n")
+            f.write(f"- **Average Chain Fragmentation:** {final_fragmentation:.1f}%\n")
+        log("Report 'simulation_results_python.md' generated successfully.")
+
+    log(f"Final Metrics:\n  Accuracy: {final_accuracy:.1f}%\n  Latency: {final_latency:.1f} days\n  Fragmentation: {final_fragmentation:.1f}%")
+    return {'accuracy': final_accuracy, 'latency': final_latency, 'fragmentation': final_fragmentation}
 
 if __name__ == '__main__':
     run_simulation()
\ No newline at end of file
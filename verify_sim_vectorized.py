@@ -0,0 +1,298 @@
+# verify_sim_vectorized.py - NumPy batch version of verify_sim.py
+#
+# Runs the same phases as verify_sim.run_simulation (solo work, pairwise sync,
+# attestation, mining) as array operations over all nodes at once, so classes
+# of thousands of students can be simulated over a school year. Needs numpy.
+# Run from backend/ like the other scripts:
+#   cd backend && PYTHONPATH=. python ../verify_sim_vectorized.py --nodes 2000 --days 180
+#   cd backend && PYTHONPATH=. python ../verify_sim_vectorized.py --validate
+#
+# Model (what is kept exact, and what is aggregated):
+# - Every node answers QUESTIONS_PER_DAY questions a day from progress 0, so
+#   all nodes share one question schedule. Each node's own completions are
+#   tracked per (day, slot): answer class, pending/mined state, first mined day.
+# - Answers reduce to two classes per question: the answer key, or the 'B'
+#   every wrong (or keyless) answer falls back to.
+# - What a node knows of other nodes' completions is a vector clock: K[i, j]
+#   is the last day of j's completions i has seen, merged by max on sync.
+#   Like the engine, a peer hands an owner back its own mined completions,
+#   which are then mined again; and attested questions are drawn from the
+#   partner's known completions (with replacement).
+# - Mempool attestations are tracked individually (a holder bitmap), chains
+#   as per-(question, answer) attestation counts plus the metric totals of
+#   the completions they hold, copied wholesale when a node adopts a chain.
+# - Reputation credits mempool attestations exactly, chain attestations pro
+#   rata by each attester's share of that (question, answer), judges "early"
+#   against the global share, and applies each day's credit in one step.
+
+import argparse
+import os
+import statistics
+
+import numpy as np
+
+# Keep importing app from touching backend/data
+os.environ.setdefault('POK_PERSISTENCE', 'none')
+from app import Curriculum
+import verify_sim
+from verify_sim import ARCHETYPES, MEETINGS_PER_WEEK, QUESTIONS_PER_DAY, SIM_DAYS, TOTAL_NODES
+
+KEY, OTHER = 0, 1  # Answer classes
+PENDING, MINED = 1, 2  # Completion states (0: not created yet)
+
+
+def tally(index, shape, weights=None) -> np.ndarray:
+    """Array of `shape` counting (or summing weights over) index tuples; np.add.at via bincount."""
+    flat = np.ravel_multi_index(index, shape)
+    return np.bincount(flat, weights, minlength=int(np.prod(shape))).reshape(shape)
+
+
+class VectorSimulation:
+    def __init__(self, curriculum, total_nodes=TOTAL_NODES, sim_days=SIM_DAYS, seed=None,
+                 quorum_conv_thresh=0.7, thought_leader_thresh=0.5, thought_leader_bonus=2.5):
+        self.rng = np.random.default_rng(seed)
+        self.n, self.days = total_nodes, sim_days
+        self.quorum_conv_thresh = quorum_conv_thresh
+        self.thought_leader_thresh = thought_leader_thresh
+        self.thought_leader_bonus = thought_leader_bonus
+
+        archetypes = verify_sim.archetype_distribution(total_nodes)
+        self.rng.shuffle(archetypes)
+        self.accuracy = np.array([ARCHETYPES.get(a, 0.5) for a in archetypes])
+
+        # Per question: the class of a correct and of a wrong answer, mirroring
+        # `ans = q.answer_key if is_correct and q.answer_key else 'B'`
+        self.q = len(curriculum)
+        keys = [question.answer_key for question in curriculum]
+        self.graded = np.array([key is not None for key in keys])
+        self.correct_cls = np.array([KEY if key else OTHER for key in keys], np.int8)
+        self.wrong_cls = np.array([KEY if key == 'B' else OTHER for key in keys], np.int8)
+
+        n, d = self.n, self.days + 1
+        slots = np.arange(d * QUESTIONS_PER_DAY).reshape(d, QUESTIONS_PER_DAY)
+        self.schedule = (slots - QUESTIONS_PER_DAY) % self.q  # Question per (day, slot); day 0 unused
+        self.day_of = np.arange(d)[None, :, None]
+        # cum_questions[k, q]: completions of question q one node makes on days 1..k
+        per_day = tally((np.repeat(np.arange(1, d), QUESTIONS_PER_DAY), self.schedule[1:].ravel()), (d, self.q))
+        self.cum_questions = np.cumsum(per_day, axis=0)
+
+        self.comp_cls = np.zeros((n, d, QUESTIONS_PER_DAY), np.int8)
+        self.comp_state = np.zeros((n, d, QUESTIONS_PER_DAY), np.int8)
+        self.first_mined = np.full((n, d, QUESTIONS_PER_DAY), -1, np.int32)
+        self.known = np.zeros((n, n), np.int32)
+        self.progress = 0
+
+        self.chain_len = np.zeros(n, np.int64)
+        self.chain_att = np.zeros((n, self.q, 2), np.int64)
+        self.chain_acc = np.zeros((n, 2))  # (correct, graded) completions on the chain
+        self.chain_lat = np.zeros((n, 2))  # (latency sum, completions) on the chain
+
+        self.att_owner = np.zeros(0, np.int64)
+        self.att_q = np.zeros(0, np.int64)
+        self.att_cls = np.zeros(0, np.int64)
+        self.att_early = np.zeros(0, bool)
+        self.holders = np.zeros((n, 0), bool)
+
+        self.reputation = np.ones(n)
+        self.att_by = np.zeros((n, self.q, 2))
+        self.early_by = np.zeros((n, self.q, 2))
+        self.att_total = np.zeros((self.q, 2))
+
+    # --- Phases ---
+    def solo_work(self, day: int):
+        for k in range(QUESTIONS_PER_DAY):
+            q = self.schedule[day, k]
+            correct = self.rng.random(self.n) < self.accuracy
+            self.comp_cls[:, day, k] = np.where(correct, self.correct_cls[q], self.wrong_cls[q])
+            self.comp_state[:, day, k] = PENDING
+        self.progress += QUESTIONS_PER_DAY
+        np.fill_diagonal(self.known, day)
+
+    def sync(self, a: np.ndarray, b: np.ndarray):
+        # Longest chain wins; ties keep their own chains
+        dst = np.concatenate([a[self.chain_len[a] < self.chain_len[b]], b[self.chain_len[b] < self.chain_len[a]]])
+        src = np.concatenate([b[self.chain_len[a] < self.chain_len[b]], a[self.chain_len[b] < self.chain_len[a]]])
+        for chain_array in (self.chain_len, self.chain_att, self.chain_acc, self.chain_lat):
+            chain_array[dst] = chain_array[src]
+
+        # The peer's copies of an owner's mined completions flow back into
+        # the owner's mempool, as Mempool.missing_from does in the engine.
+        for owner, peer in ((a, b), (b, a)):
+            state = self.comp_state[owner]
+            seen = self.day_of <= self.known[peer, owner][:, None, None]
+            state[(state == MINED) & seen] = PENDING
+            self.comp_state[owner] = state
+
+        merged = self.holders[a] | self.holders[b]
+        self.holders[a] = merged
+        self.holders[b] = merged
+        known = np.maximum(self.known[a], self.known[b])
+        self.known[a] = known
+        self.known[b] = known
+
+    def attest(self, attesters: np.ndarray, partners: np.ndarray):
+        # Question mix of each partner's mempool completions: everything it has
+        # seen from others, plus its own still pending.
+        others = self.known[partners].copy()
+        others[np.arange(len(partners)), partners] = 0
+        seen_days = tally((np.repeat(np.arange(len(partners)), self.n), others.ravel()), (len(partners), self.days + 1))
+        seen_days[:, 0] = 0
+        mix = seen_days @ self.cum_questions
+        rows, days, slots = np.nonzero(self.comp_state[partners] == PENDING)
+        mix += tally((rows, self.schedule[days, slots]), mix.shape)
+
+        total = mix.sum(axis=1)
+        has_any = total > 0
+        count = np.zeros(len(partners), np.int64)
+        count[has_any] = self.rng.integers(1, np.minimum(3, total[has_any]) + 1)
+        cdf = np.cumsum(mix, axis=1)
+
+        owners, questions = [], []
+        for k in range(3):
+            active = count > k
+            u = self.rng.random(int(active.sum())) * total[active]
+            owners.append(attesters[active])
+            questions.append((cdf[active] <= u[:, None]).sum(axis=1))
+        owners, questions = np.concatenate(owners), np.concatenate(questions)
+        correct = self.rng.random(len(owners)) < self.accuracy[owners]
+        classes = np.where(correct, self.correct_cls[questions], self.wrong_cls[questions]).astype(np.int64)
+
+        seen = self.att_total[questions].sum(axis=1)
+        share = np.divide(self.att_total[questions, classes], seen, out=np.zeros(len(owners)), where=seen > 0)
+        early = share < self.thought_leader_thresh
+        self.att_by += tally((owners, questions, classes), self.att_by.shape)
+        self.early_by += tally((owners, questions, classes), self.early_by.shape, early)
+        self.att_total += tally((questions, classes), self.att_total.shape)
+
+        new_holders = np.zeros((self.n, len(owners)), bool)
+        new_holders[owners, np.arange(len(owners))] = True
+        self.holders = np.concatenate([self.holders, new_holders], axis=1)
+        self.att_owner = np.concatenate([self.att_owner, owners])
+        self.att_q = np.concatenate([self.att_q, questions])
+        self.att_cls = np.concatenate([self.att_cls, classes])
+        self.att_early = np.concatenate([self.att_early, early])
+
+    def _to_chain(self, rows: np.ndarray, cols: np.ndarray):
+        self.chain_att += tally((rows, self.att_q[cols], self.att_cls[cols]), self.chain_att.shape).astype(np.int64)
+        self.holders[rows, cols] = False
+
+    def mine(self, day: int):
+        # Attestation blocks: five or more attestations waiting
+        rows, cols = np.nonzero(self.holders)
+        waiting = np.bincount(rows, minlength=self.n)
+        full = waiting >= 5
+        self.chain_len[full] += 1
+        self._to_chain(rows[full[rows]], cols[full[rows]])
+
+        # PoK blocks: own completions whose question reached quorum
+        rows, cols = np.nonzero(self.holders)
+        pending_att = tally((rows, self.att_q[cols], self.att_cls[cols]), self.chain_att.shape)
+        visible = self.chain_att + pending_att
+        total = visible.sum(axis=2)
+        share = np.divide(visible.max(axis=2), total, out=np.zeros(total.shape), where=total > 0)
+        min_attest = 2 if self.progress < self.q / 2 else 4
+        ready = (total >= min_attest) & (share >= self.quorum_conv_thresh)
+
+        minable = (self.comp_state == PENDING) & ready[:, self.schedule]
+        miners = minable.any(axis=(1, 2))
+        if not miners.any():
+            return
+        self.chain_len[miners] += 1
+        self.first_mined[minable & (self.first_mined < 0)] = day
+        self.comp_state[minable] = MINED
+
+        node, d, k = np.nonzero(minable)
+        question, cls = self.schedule[d, k], self.comp_cls[node, d, k]
+        graded = self.graded[question]
+        self.chain_acc[:, 0] += np.bincount(node[graded], cls[graded] == KEY, minlength=self.n)
+        self.chain_acc[:, 1] += np.bincount(node[graded], minlength=self.n)
+        self.chain_lat[:, 0] += np.bincount(node, self.first_mined[node, d, k] - d, minlength=self.n)
+        self.chain_lat[:, 1] += np.bincount(node, minlength=self.n)
+
+        # Reputation: each mined completion credits every visible attestation
+        # that backed its answer, with the bonus for early ones.
+        mined = tally((node, question, cls), (self.n, self.q, 2))
+        backing = mined[rows, self.att_q[cols], self.att_cls[cols]]
+        bonus = np.where(self.att_early[cols], self.thought_leader_bonus, 1.0)
+        credit = np.bincount(self.att_owner[cols], backing * bonus, minlength=self.n)
+        chain_backing = np.einsum('nqc,nqc->qc', mined, self.chain_att)
+        per_attestation = np.divide(chain_backing, self.att_total, out=np.zeros(chain_backing.shape), where=self.att_total > 0)
+        weights = self.att_by + (self.thought_leader_bonus - 1.0) * self.early_by
+        credit += np.einsum('nqc,qc->n', weights, per_attestation)
+        self.reputation += credit * np.log1p(self.reputation)
+
+        # The block also takes the pending attestations for the mined questions
+        taken = mined.sum(axis=2)[rows, self.att_q[cols]] > 0
+        self._to_chain(rows[taken], cols[taken])
+
+    def _compact(self):
+        live = self.holders.any(axis=0)
+        self.holders = self.holders[:, live]
+        for name in ('att_owner', 'att_q', 'att_cls', 'att_early'):
+            setattr(self, name, getattr(self, name)[live])
+
+    def fragmentation(self) -> float:
+        longest = self.chain_len.max()
+        return 0.0 if longest == 0 else float((self.chain_len < longest).mean() * 100)
+
+    def run(self) -> dict:
+        daily_fragmentation = []
+        for day in range(1, self.days + 1):
+            self.solo_work(day)
+            if (day - 1) % 5 < MEETINGS_PER_WEEK:
+                order = self.rng.permutation(self.n)
+                pairs = len(order) // 2 * 2
+                a, b = order[0:pairs:2], order[1:pairs:2]
+                self.sync(a, b)
+                self.attest(np.concatenate([a, b]), np.concatenate([b, a]))
+                self.mine(day)
+                self._compact()
+            daily_fragmentation.append(self.fragmentation())
+
+        graded = self.chain_acc[:, 1].sum()
+        mined = self.chain_lat[:, 1].sum()
+        return {
+            'accuracy': self.chain_acc[:, 0].sum() / graded * 100 if graded else 100.0,
+            'latency': self.chain_lat[:, 0].sum() / mined if mined else 0.0,
+            'fragmentation': statistics.mean(daily_fragmentation) if daily_fragmentation else 0.0,
+        }
+
+
+def run_vectorized(total_nodes=TOTAL_NODES, sim_days=SIM_DAYS, seed=None,
+                   curriculum_file='pok_curriculum_trimmed.json', **engine_params) -> dict:
+    return VectorSimulation(
+        Curriculum.load(curriculum_file), total_nodes, sim_days, seed, **engine_params
+    ).run()
+
+
+def validate(configs=((20, 10), (40, 30)), seeds=range(5)):
+    """Compares metric means over seeds against the object engine."""
+    print(f"{'nodes':>5} {'days':>4}  {'metric':<13} {'object engine':>16} {'vectorized':>16}")
+    for total_nodes, sim_days in configs:
+        runs = {'object engine': [], 'vectorized': []}
+        for seed in seeds:
+            runs['object engine'].append(verify_sim.run_simulation(
+                sim_days, total_nodes, seed=seed, verbose=False, write_report=False))
+            runs['vectorized'].append(run_vectorized(total_nodes, sim_days, seed=seed))
+        for metric in ('accuracy', 'latency', 'fragmentation'):
+            cells = []
+            for results in runs.values():
+                values = [r[metric] for r in results]
+                cells.append(f"{statistics.mean(values):7.1f} ± {statistics.stdev(values):5.1f}")
+            print(f"{total_nodes:>5} {sim_days:>4}  {metric:<13} {cells[0]:>16} {cells[1]:>16}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='NumPy batch simulation of the POK engine')
+    parser.add_argument('--nodes', type=int, default=TOTAL_NODES)
+    parser.add_argument('--days', type=int, default=SIM_DAYS)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--curriculum', default='pok_curriculum_trimmed.json')
+    parser.add_argument('--validate', action='store_true', help='compare against the object engine')
+    args = parser.parse_args()
+    if args.validate:
+        validate()
+    else:
+        metrics = run_vectorized(args.nodes, args.days, args.seed, args.curriculum)
+        print(f"Final Metrics:\n  Accuracy: {metrics['accuracy']:.1f}%\n"
+              f"  Latency: {metrics['latency']:.1f} days\n  Fragmentation: {metrics['fragmentation']:.1f}%")